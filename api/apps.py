@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Connect the hobbies_changed receivers
+        from . import autocomplete, caching, etags, events, feed, graph, minhash, precompute, similarity, sparse, weights  # noqa: F401
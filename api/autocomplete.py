@@ -0,0 +1,114 @@
+"""
+Prefix search over the hobby vocabulary, for autocomplete.
+
+Every worker keeps the normalized name of each hobby, plus every suffix of it
+starting at a word ("board games" is also filed under "games"), in one
+sorted list. The entries matching a prefix are then a contiguous slice found
+with two binary searches, and are ranked by popularity (``user_count``).
+
+The list is rebuilt when the ``hobbies`` version counter moves, which happens
+whenever a hobby is created, renamed or deleted. It is also rebuilt after
+``HOBBY_SEARCH_MAX_AGE`` seconds, so the popularity counts stay roughly
+current.
+"""
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Hobby, normalize_hobby_name
+from .signals import hobbies_created
+from .versions import bump, get_versions
+
+VOCABULARY_VERSION = 'hobbies'
+
+# Most results a single search returns
+MAX_RESULTS = 50
+
+# Ranked results remembered per prefix, until the next rebuild
+MEMO_SIZE = 10000
+
+
+class PrefixIndex:
+    """Sorted word-start keys of every hobby name, searched with ``bisect``."""
+
+    def __init__(self, hobbies, version):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.hobbies = {}  # hobby id -> (name, user_count)
+        entries = []
+        for hobby_id, name, normalized_name, user_count in hobbies:
+            self.hobbies[hobby_id] = (name, user_count)
+            start = 0
+            for word in normalized_name.split(' '):
+                entries.append((normalized_name[start:], hobby_id))
+                start += len(word) + 1
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.ids = array('q', (hobby_id for _, hobby_id in entries))
+        self.memo = {}
+
+    def search(self, prefix, limit):
+        """``(id, name, user_count)`` of the most popular hobbies with a word starting with ``prefix``."""
+        ranked = self.memo.get(prefix)
+        if ranked is None:
+            start = bisect_left(self.keys, prefix)
+            # Every key starting with prefix sorts before prefix + the largest code point
+            end = bisect_left(self.keys, prefix + '\U0010ffff', start)
+            matches = set(self.ids[start:end])
+            ranked = heapq.nsmallest(
+                MAX_RESULTS, matches, key=lambda hobby_id: (-self.hobbies[hobby_id][1], self.hobbies[hobby_id][0])
+            )
+            if len(self.memo) >= MEMO_SIZE:
+                self.memo.clear()
+            self.memo[prefix] = ranked
+        return [(hobby_id, *self.hobbies[hobby_id]) for hobby_id in ranked[:limit]]
+
+
+class SharedPrefixIndex:
+    """The per-worker ``PrefixIndex``, rebuilt when the vocabulary version moves."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+
+    def get(self):
+        version = get_versions([VOCABULARY_VERSION])[VOCABULARY_VERSION]
+        with self.lock:
+            index = self.index
+            if (
+                index is None
+                or index.version != version
+                or time.monotonic() - index.built_at > settings.HOBBY_SEARCH_MAX_AGE
+            ):
+                hobbies = Hobby.objects.values_list('id', 'name', 'normalized_name', 'user_count')
+                index = self.index = PrefixIndex(hobbies.iterator(chunk_size=10000), version)
+            return index
+
+    def reset(self):
+        """Forget the loaded index, e.g. after the database was replaced."""
+        with self.lock:
+            self.index = None
+
+
+hobby_prefixes = SharedPrefixIndex()
+
+
+def search(query, limit=10):
+    return hobby_prefixes.get().search(normalize_hobby_name(query), min(limit, MAX_RESULTS))
+
+
+@receiver(post_save, sender=Hobby)
+@receiver(post_delete, sender=Hobby)
+def bump_vocabulary(sender, **kwargs):
+    bump(VOCABULARY_VERSION)
+
+
+@receiver(hobbies_created)
+def bump_vocabulary_after_bulk_create(sender, hobby_ids, **kwargs):
+    bump(VOCABULARY_VERSION)
@@ -0,0 +1,121 @@
+"""
+Cache for ``top_users`` pages.
+
+A page is cached under a key built from the request parameters and the
+versions of the requester (``user:<id>``) and of each of their hobbies
+(``hobby:<id>``). Changing someone's hobbies bumps the versions of that user
+and of every hobby they had or now have, and changing a birth date bumps the
+user's hobbies too: exactly the requesters who could see that user among
+their matches get a new key.
+
+The key also holds the requester's ``friends:<id>`` version (see
+api/etags.py) and ``friend_requests:<id>`` version, so new friends and
+requests drop out of the page at once. Friends of friends made by other
+users show up when the page expires.
+
+Concurrent misses for the same key are collapsed: one request computes the
+page while the others wait for it to appear in the cache.
+"""
+import hashlib
+import json
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import matching
+from .etags import friends_version_key
+from .models import FriendRequest
+from .signals import date_of_birth_changed, hobbies_changed
+from .versions import bump, get_versions
+
+# Seconds a computation may hold the single-flight lock
+LOCK_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+
+
+def user_version_key(user_id):
+    return f'user:{user_id}'
+
+
+def hobby_version_key(hobby_id):
+    return f'hobby:{hobby_id}'
+
+
+def requests_version_key(user_id):
+    return f'friend_requests:{user_id}'
+
+
+def hobby_ids_of(user, user_version):
+    # The hobby list only changes together with the user's version
+    key = f'recs:hobbies:{user.id}:{user_version}'
+    hobby_ids = cache.get(key)
+    if hobby_ids is None:
+        hobby_ids = sorted(user.hobbies.values_list('id', flat=True))
+        cache.set(key, hobby_ids, settings.RECOMMENDATION_CACHE_TIMEOUT)
+    return hobby_ids
+
+
+def single_flight(key, compute, timeout):
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        # Someone else is computing the same value; wait for it
+        time.sleep(POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if time.monotonic() > deadline:
+            return compute()
+    try:
+        value = compute()
+        cache.set(key, value, timeout)
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+def top_users(user, min_age, max_age, page_number=1, cursor=None, backend=None, similarity=None):
+    """``matching.top_users`` behind the cache."""
+    user_keys = [user_version_key(user.id), friends_version_key(user.id), requests_version_key(user.id)]
+    user_versions = get_versions(user_keys)
+    user_version = user_versions[user_version_key(user.id)]
+    hobby_versions = get_versions([hobby_version_key(hobby_id) for hobby_id in hobby_ids_of(user, user_version)])
+    parts = [
+        user.id, [user_versions[key] for key in user_keys], sorted(hobby_versions.items()),
+        # Ages move on every day
+        date.today().isoformat(),
+        min_age, max_age, page_number, cursor,
+        backend or settings.HOBBY_MATCH_BACKEND, similarity or settings.HOBBY_MATCH_SIMILARITY,
+    ]
+    key = 'recs:' + hashlib.md5(json.dumps(parts).encode()).hexdigest()
+    return single_flight(
+        key,
+        lambda: matching.top_users(user, min_age, max_age, page_number, cursor, backend, similarity),
+        settings.RECOMMENDATION_CACHE_TIMEOUT,
+    )
+
+
+@receiver(hobbies_changed)
+def invalidate_hobby_matches(sender, user, added, removed, **kwargs):
+    current = set(user.hobbies.values_list('id', flat=True))
+    bump(user_version_key(user.id), *(hobby_version_key(hobby_id) for hobby_id in current | set(removed)))
+
+
+@receiver(date_of_birth_changed)
+def invalidate_age_matches(sender, user, **kwargs):
+    hobby_ids = user.hobbies.values_list('id', flat=True)
+    bump(user_version_key(user.id), *(hobby_version_key(hobby_id) for hobby_id in hobby_ids))
+
+
+@receiver(post_save, sender=FriendRequest)
+@receiver(post_delete, sender=FriendRequest)
+def invalidate_request_matches(sender, instance, **kwargs):
+    bump(requests_version_key(instance.from_user_id), requests_version_key(instance.to_user_id))
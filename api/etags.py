@@ -0,0 +1,96 @@
+"""
+Conditional GET for the JSON views.
+
+A view decorated with ``versioned_etag`` gets an ETag computed from version
+counters (see api/versions.py) instead of from its body, so a client
+repeating a request for unchanged data gets a 304 after one cache lookup,
+without the view running at all. The receivers below bump the counters
+whenever the data behind them changes.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import CustomUser, Friendship
+from .versions import bump, get_versions
+
+
+# Fields of a user that appear in their friends' friend lists
+FRIEND_LIST_FIELDS = {'username', 'email', 'first_name', 'last_name', 'date_of_birth'}
+
+
+def profile_version_key(user_id):
+    return f'profile:{user_id}'
+
+
+def friends_version_key(user_id):
+    return f'friends:{user_id}'
+
+
+def versioned_etag(*names):
+    """
+    ``names`` are version counter names, or callables turning the request
+    into one, e.g. ``lambda request: profile_version_key(request.user.id)``.
+    """
+    def decorator(view):
+        def etag(request, *args, **kwargs):
+            keys = [name(request) if callable(name) else name for name in names]
+            versions = get_versions(keys)
+            # The view name keeps equal versions of different resources apart
+            tag = ':'.join([view.__name__] + [f'{key}={versions[key]}' for key in keys])
+            return hashlib.md5(tag.encode()).hexdigest()
+
+        conditional_view = condition(etag_func=etag)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            # Per-user data: browsers keep it, but always revalidate
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def own_profile(request):
+    return profile_version_key(request.user.id)
+
+
+def own_friends(request):
+    return friends_version_key(request.user.id)
+
+
+@receiver(post_save, sender=CustomUser)
+def bump_profile(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login', 'password', 'hobby_count'}:
+        # Fields that never appear in a response
+        return
+    bump(profile_version_key(instance.id))
+    if not created and (update_fields is None or FRIEND_LIST_FIELDS & set(update_fields)):
+        # Friends' lists show these fields of this user
+        friend_ids = instance.friends.values_list('id', flat=True)
+        bump(*[friends_version_key(friend_id) for friend_id in friend_ids])
+
+
+@receiver(m2m_changed, sender=CustomUser.hobbies.through)
+def bump_profile_hobbies(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Changed from the hobby's side: pk_set holds users
+        bump(*[profile_version_key(user_id) for user_id in pk_set or ()])
+    else:
+        bump(profile_version_key(instance.id))
+
+
+@receiver(m2m_changed, sender=Friendship)
+def bump_friends(sender, instance, action, pk_set, **kwargs):
+    if action.startswith('post_'):
+        bump(friends_version_key(instance.id), *[friends_version_key(user_id) for user_id in pk_set or ()])
+
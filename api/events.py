@@ -0,0 +1,135 @@
+"""
+Server-sent events: new threads and incoming friend requests, pushed to
+connected browsers instead of them refetching whole lists.
+
+Every open ``/events/`` stream is a ``Subscription`` holding a bounded
+queue, served by a coroutine that sleeps until something arrives. An
+idle stream therefore costs a queue and a suspended coroutine, not a
+thread, so one ASGI worker holds thousands of them.
+
+The receivers below publish from whatever thread saved the row, once its
+transaction commits. Each event is serialized once and handed to every
+recipient's event loop with ``call_soon_threadsafe``. Delivery is
+in-process: a client only hears about writes made by the worker serving
+its stream, and refetches the lists whenever it (re)connects.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import FriendRequest, Thread
+
+# Milliseconds a disconnected EventSource waits before reconnecting
+RETRY_MS = 5000
+
+
+def format_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+class Subscription:
+    """One open stream: the events waiting to be written to it."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, message):
+        # Runs on the subscription's event loop
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # The client is not keeping up; end its stream so it reconnects and refetches
+            self.overflowed = True
+
+
+class Broker:
+    """The open subscriptions of this process, by user id."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def __bool__(self):
+        return bool(self.subscriptions)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self.lock:
+            self.subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            user_subscriptions = self.subscriptions.get(subscription.user_id)
+            if user_subscriptions is not None:
+                user_subscriptions.discard(subscription)
+                if not user_subscriptions:
+                    del self.subscriptions[subscription.user_id]
+
+    def publish(self, message, user_ids=None):
+        """Send an already formatted event to ``user_ids``, or to everyone connected."""
+        with self.lock:
+            if user_ids is None:
+                recipients = [s for user_subscriptions in self.subscriptions.values() for s in user_subscriptions]
+            else:
+                recipients = [s for user_id in user_ids for s in self.subscriptions.get(user_id, ())]
+        for subscription in recipients:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # Its loop has shut down; the stream's cleanup will unsubscribe it
+                pass
+
+
+broker = Broker()
+
+
+async def stream(user_id):
+    """The body of one user's event stream."""
+    subscription = broker.subscribe(user_id)
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        while not subscription.overflowed:
+            try:
+                yield await asyncio.wait_for(subscription.queue.get(), settings.EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ': heartbeat\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@receiver(post_save, sender=Thread)
+def publish_thread(sender, instance, created, **kwargs):
+    if not created or not broker:
+        return
+    # Same fields as the thread list
+    message = format_event('thread', {
+        'id': instance.id,
+        'content': instance.content,
+        'created_at': instance.created_at,
+        'user__username': instance.user.username,
+    })
+    transaction.on_commit(lambda: broker.publish(message))
+
+
+@receiver(post_save, sender=FriendRequest)
+def publish_friend_request(sender, instance, created, **kwargs):
+    if not created or instance.to_user_id not in broker.subscriptions:
+        return
+    # Same fields as get_friend_requests
+    message = format_event('friend_request', {
+        'id': instance.id,
+        'from_user': {'id': instance.from_user_id, 'username': instance.from_user.username},
+    })
+    transaction.on_commit(lambda: broker.publish(message, [instance.to_user_id]))
@@ -0,0 +1,127 @@
+"""
+Friends feed: the newest threads of a user's friends.
+
+Threads are fanned out on write: posting a thread inserts one
+``TimelineEntry`` per friend of the author, so reading a feed page is a single
+range scan over the owner's entries, however many friends they have.
+
+Authors with more than ``FEED_FANOUT_MAX_FRIENDS`` friends would make every
+post write that many rows. Their threads are stored with ``fanned_out=False``
+instead and merged into their friends' feeds at read time, through the small
+partial index over just those threads.
+"""
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+
+from .models import CustomUser, Friendship, Thread, TimelineEntry
+
+FIELDS = ('id', 'content', 'created_at', 'user__username')
+
+
+def after(queryset, cursor, created_at_field, id_field):
+    """Rows after ``cursor`` (created_at, id) in newest-first order, as one index range."""
+    if cursor is None:
+        return queryset
+    created_at, row_id = cursor
+    return queryset.filter(**{f'{created_at_field}__lte': created_at}).exclude(
+        **{created_at_field: created_at, f'{id_field}__gte': row_id}
+    )
+
+
+def feed_page(user, limit, cursor=None):
+    """
+    Up to ``limit + 1`` threads (dicts with ``FIELDS``) after ``cursor``,
+    newest first; the extra one tells whether there is a next page.
+    """
+    entries = after(
+        TimelineEntry.objects.filter(owner=user).order_by('-created_at', '-thread_id'),
+        cursor, 'created_at', 'thread_id',
+    ).values_list('thread_id', 'thread__content', 'created_at', 'thread__user__username')[:limit + 1]
+    unfanned = after(
+        Thread.objects.filter(fanned_out=False, user__in=user.friends.values('id')).order_by('-created_at', '-id'),
+        cursor, 'created_at', 'id',
+    ).values_list(*FIELDS)[:limit + 1]
+
+    # Both lists are already newest first
+    newest_first = heapq.merge(entries, unfanned, key=lambda row: (row[2], row[0]), reverse=True)
+    return [dict(zip(FIELDS, row)) for row in islice(newest_first, limit + 1)]
+
+
+def fan_out(thread):
+    friend_ids = list(
+        Friendship.objects.filter(user_id=thread.user_id)
+        .values_list('friend_id', flat=True)[:settings.FEED_FANOUT_MAX_FRIENDS + 1]
+    )
+    if len(friend_ids) > settings.FEED_FANOUT_MAX_FRIENDS:
+        Thread.objects.filter(id=thread.id).update(fanned_out=False)
+        thread.fanned_out = False
+        return
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(owner_id=friend_id, thread_id=thread.id, created_at=thread.created_at) for friend_id in friend_ids],
+        batch_size=1000,
+    )
+
+
+def backfill(owner_id, author_id):
+    """Copy the author's latest fanned out threads into a new friend's timeline."""
+    threads = (
+        Thread.objects.filter(user_id=author_id, fanned_out=True)
+        .order_by('-created_at', '-id')
+        .values_list('id', 'created_at')[:settings.FEED_BACKFILL_THREADS]
+    )
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(owner_id=owner_id, thread_id=thread_id, created_at=created_at) for thread_id, created_at in threads],
+        ignore_conflicts=True,
+    )
+
+
+def rebuild():
+    """Recompute which authors fan out and every timeline, from the threads and friendships."""
+    hubs = (
+        CustomUser.objects.annotate(friend_count=Count('friends'))
+        .filter(friend_count__gt=settings.FEED_FANOUT_MAX_FRIENDS)
+        .values('id')
+    )
+    with transaction.atomic():
+        Thread.objects.exclude(fanned_out=True).update(fanned_out=True)
+        Thread.objects.filter(user__in=hubs).update(fanned_out=False)
+        TimelineEntry.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(REBUILD_SQL.format(
+                timeline=connection.ops.quote_name(TimelineEntry._meta.db_table),
+                thread=connection.ops.quote_name(Thread._meta.db_table),
+                friendship=connection.ops.quote_name(Friendship._meta.db_table),
+            ), [True])
+
+
+REBUILD_SQL = """
+    INSERT INTO {timeline} (owner_id, thread_id, created_at)
+    SELECT f.friend_id, t.id, t.created_at
+    FROM {thread} t
+    JOIN {friendship} f ON f.user_id = t.user_id
+    WHERE t.fanned_out = %s
+"""
+
+
+@receiver(post_save, sender=Thread)
+def fan_out_new_thread(sender, instance, created, **kwargs):
+    if created:
+        fan_out(instance)
+
+
+@receiver(m2m_changed, sender=Friendship)
+def update_timelines(sender, instance, action, pk_set, **kwargs):
+    if action == 'post_add':
+        for friend_id in pk_set:
+            backfill(instance.id, friend_id)
+            backfill(friend_id, instance.id)
+    elif action == 'post_remove':
+        for friend_id in pk_set:
+            TimelineEntry.objects.filter(owner_id=instance.id, thread__user_id=friend_id).delete()
+            TimelineEntry.objects.filter(owner_id=friend_id, thread__user_id=instance.id).delete()
@@ -1,13 +1,40 @@
 from django.contrib.auth.forms import UserCreationForm
-from .models import CustomUser, Hobby
+from .models import CustomUser, Hobby, normalize_hobby_name
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import authenticate
 
+class HobbyAutocomplete(forms.SelectMultiple):
+    """
+    Renders only the selected hobbies instead of the whole vocabulary; the
+    signup page fetches the other options from /hobbies/search while typing.
+    """
+
+    def optgroups(self, name, value, attrs=None):
+        selected = Hobby.objects.filter(
+            normalized_name__in=[normalize_hobby_name(hobby_name) for hobby_name in value if hobby_name]
+        ).values_list('name', flat=True)
+        return [
+            (None, [self.create_option(name, hobby_name, hobby_name, True, index)], index)
+            for index, hobby_name in enumerate(selected)
+        ]
+
+
+class HobbyChoiceField(forms.ModelMultipleChoiceField):
+    """Chooses hobbies by name, ignoring case and extra whitespace."""
+
+    def __init__(self, **kwargs):
+        super().__init__(queryset=Hobby.objects.all(), to_field_name='normalized_name', **kwargs)
+
+    def clean(self, value):
+        if value and isinstance(value, (list, tuple)):
+            value = [normalize_hobby_name(str(name)) for name in value]
+        return super().clean(value)
+
+
 class CustomUserCreationForm(UserCreationForm):
-    hobbies = forms.ModelMultipleChoiceField(
-        queryset=Hobby.objects.all(),
-        widget=forms.SelectMultiple(attrs={'id': 'hobbies-select'}),  
+    hobbies = HobbyChoiceField(
+        widget=HobbyAutocomplete(attrs={'id': 'hobbies-select'}),  
         required=False
     )
 
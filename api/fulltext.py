@@ -0,0 +1,118 @@
+"""
+Full-text search over ``Thread.content``.
+
+SQLite keeps an FTS5 table (``api_thread_fts``) with the thread table as its
+external content. Triggers on the thread table index every insert, update
+and delete, including bulk inserts. PostgreSQL keeps a generated
+``search_vector`` tsvector column on the thread table with a GIN index.
+
+Both are created by migration 0012_thread_search. ``install()`` recreates
+them if they are missing and reindexes every thread; the
+rebuild_thread_search command calls it. On SQLite, migrations that rebuild the thread table drop its triggers,
+so run the command after them.
+"""
+import re
+
+from django.db import connection
+from django.utils.html import escape
+
+from .models import Thread
+
+FTS_TABLE = 'api_thread_fts'
+SEARCH_INDEX = 'thread_search_idx'
+
+# Marks put around matching words by the database, replaced by <mark> tags
+# once the rest of the snippet is escaped
+START, STOP = '\x02', '\x03'
+SNIPPET_WORDS = 16
+
+SQLITE_INSTALL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        content, content='api_thread', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON api_thread BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON api_thread BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF content ON api_thread BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+POSTGRES_INSTALL = [
+    """ALTER TABLE api_thread ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', content)) STORED""",
+    f"CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} ON api_thread USING GIN (search_vector)",
+    f"REINDEX INDEX {SEARCH_INDEX}",
+]
+
+SQLITE_SEARCH = f"""
+    SELECT rowid, snippet({FTS_TABLE}, 0, %s, %s, '…', %s)
+    FROM {FTS_TABLE}
+    WHERE {FTS_TABLE} MATCH %s
+    ORDER BY bm25({FTS_TABLE}), rowid
+    LIMIT %s OFFSET %s
+"""
+
+POSTGRES_SEARCH = """
+    SELECT t.id, ts_headline('english', t.content, q, %s)
+    FROM api_thread t, to_tsquery('english', %s) q
+    WHERE t.search_vector @@ q
+    ORDER BY ts_rank(t.search_vector, q) DESC, t.id
+    LIMIT %s OFFSET %s
+"""
+
+
+def supported():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def install():
+    statements = SQLITE_INSTALL if connection.vendor == 'sqlite' else POSTGRES_INSTALL
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def terms(query):
+    """Words of a user's query; every other character is dropped, so no search syntax gets through."""
+    return re.findall(r'\w+', query.casefold())
+
+
+def highlight(snippet):
+    return escape(snippet).replace(START, '<mark>').replace(STOP, '</mark>')
+
+
+def search(query, limit, offset=0):
+    """
+    Threads matching every word of ``query`` (the last one as a prefix, for
+    search-as-you-type), best match first, as dicts with an HTML ``snippet``.
+    """
+    words = terms(query)
+    if not words:
+        return []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            match = ' '.join(f'"{word}"' for word in words) + '*'
+            cursor.execute(SQLITE_SEARCH, [START, STOP, SNIPPET_WORDS, match, limit, offset])
+        else:
+            match = ' & '.join(words) + ':*'
+            options = f'StartSel={START}, StopSel={STOP}, MaxWords={SNIPPET_WORDS}, MinWords=5'
+            cursor.execute(POSTGRES_SEARCH, [options, match, limit, offset])
+        ranked = cursor.fetchall()
+
+    threads = {
+        thread['id']: thread
+        for thread in Thread.objects.filter(id__in=[thread_id for thread_id, _ in ranked])
+        .values('id', 'content', 'created_at', 'user__username')
+    }
+    return [
+        {**threads[thread_id], 'snippet': highlight(snippet)}
+        for thread_id, snippet in ranked
+        # Deleted between the two queries
+        if thread_id in threads
+    ]
@@ -0,0 +1,227 @@
+"""
+In-memory friend graph, for mutual friends, degrees and friends of friends.
+
+Every worker keeps the friendships as CSR adjacency arrays: the sorted ids
+of users with friends, one offset per user into a flat array of friend ids,
+and the friend ids themselves, sorted per user. A user's friends are then
+a binary search and a slice, with no query and no per-edge Python object;
+a million friendships take about 8 MB.
+
+Friendships made or ended in this worker are recorded in an overlay of
+changed users and folded into the arrays once enough of them pile up. Other
+workers' changes are picked up when the graph is reloaded after
+``FRIEND_GRAPH_MAX_AGE`` seconds. With a shared cache (see api/versions.py)
+the rebuild_friend_graph command also makes every worker reload at once,
+by bumping the ``friend_graph`` version; a per-process cache has no version
+other processes could bump, so there only the age counts.
+"""
+import heapq
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+
+from .models import CustomUser, Friendship
+from .versions import bump, get_versions, shared_cache
+
+GRAPH_VERSION = 'friend_graph'
+
+# Changed users allowed in the overlay before it is folded into the arrays
+COMPACT_AFTER = 10000
+
+
+class GraphState:
+    """An immutable snapshot of the adjacency arrays."""
+
+    def __init__(self, user_ids, offsets, friend_ids, version):
+        self.user_ids = user_ids
+        self.offsets = offsets
+        self.friend_ids = friend_ids
+        self.version = version
+        self.built_at = time.monotonic()
+
+    def friends_of(self, user_id):
+        row = bisect_left(self.user_ids, user_id)
+        if row == len(self.user_ids) or self.user_ids[row] != user_id:
+            return ()
+        return self.friend_ids[self.offsets[row]:self.offsets[row + 1]]
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.user_ids, self.offsets, self.friend_ids))
+
+
+class FriendGraph:
+    """The per-worker adjacency arrays plus the overlay of changes made since they were built."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+        self.changed = {}  # user id -> set of friend ids, for users changed since the build
+
+    def refresh(self):
+        # Called with the lock held. A per-process cache's counter is this
+        # worker's own and expires, so it would only force needless reloads
+        version = get_versions([GRAPH_VERSION])[GRAPH_VERSION] if shared_cache() else None
+        if (
+            self.state is None
+            or self.state.version != version
+            or time.monotonic() - self.state.built_at > settings.FRIEND_GRAPH_MAX_AGE
+        ):
+            self.load(version)
+        elif len(self.changed) > COMPACT_AFTER:
+            self.compact()
+
+    def load(self, version):
+        self.changed.clear()
+        user_ids, offsets, friend_ids = array('q'), array('q', [0]), array('q')
+        # Walks the (user, friend) unique index in order, so every row comes out sorted
+        rows = Friendship.objects.order_by('user_id', 'friend_id').values_list('user_id', 'friend_id')
+        for user_id, friend_id in rows.iterator(chunk_size=10000):
+            if not user_ids or user_ids[-1] != user_id:
+                if user_ids:
+                    offsets.append(len(friend_ids))
+                user_ids.append(user_id)
+            friend_ids.append(friend_id)
+        if user_ids:
+            offsets.append(len(friend_ids))
+        self.state = GraphState(user_ids, offsets, friend_ids, version)
+
+    def compact(self):
+        """Fold the overlay into new arrays without going back to the database."""
+        state = self.state
+        user_ids, offsets, friend_ids = array('q'), array('q', [0]), array('q')
+        for user_id in sorted(set(state.user_ids) | set(self.changed)):
+            friends = self.changed.get(user_id)
+            friends = state.friends_of(user_id) if friends is None else sorted(friends)
+            if friends:
+                user_ids.append(user_id)
+                friend_ids.extend(friends)
+                offsets.append(len(friend_ids))
+        self.state = GraphState(user_ids, offsets, friend_ids, state.version)
+        # A compaction is not a reload; keep the original age for the refresh timer
+        self.state.built_at = state.built_at
+        self.changed.clear()
+
+    def friends_of(self, user_id):
+        # Called with the lock held
+        friends = self.changed.get(user_id)
+        return self.state.friends_of(user_id) if friends is None else friends
+
+    def friends(self, user_id):
+        with self.lock:
+            self.refresh()
+            return list(self.friends_of(user_id))
+
+    def degree(self, user_id):
+        with self.lock:
+            self.refresh()
+            return len(self.friends_of(user_id))
+
+    def mutual_friends(self, user_id, other_id):
+        """Ids of the friends two users share."""
+        with self.lock:
+            self.refresh()
+            mine, theirs = self.friends_of(user_id), self.friends_of(other_id)
+        if len(mine) > len(theirs):
+            mine, theirs = theirs, mine
+        theirs = set(theirs)
+        return sorted(friend_id for friend_id in mine if friend_id in theirs)
+
+    def friends_of_friends(self, user_id, limit, max_edges, exclude=()):
+        """
+        ``(id, mutual friend count)`` of the users with the most friends in
+        common with ``user_id``, who are neither the user, their friends nor in
+        ``exclude``. At most ``max_edges`` friendships are read: friends with
+        fewer friends are expanded first, since a hub's friends say little about
+        whom the user knows, so hubs are the ones cut off.
+        """
+        mutual = Counter()
+        budget = max_edges
+        with self.lock:
+            self.refresh()
+            friends = self.friends_of(user_id)
+            for second in sorted((self.friends_of(friend_id) for friend_id in friends), key=len):
+                if len(second) > budget:
+                    break
+                budget -= len(second)
+                mutual.update(second)
+        skip = set(friends) | set(exclude) | {user_id}
+        candidates = ((candidate, count) for candidate, count in mutual.items() if candidate not in skip)
+        return heapq.nsmallest(limit, candidates, key=lambda item: (-item[1], item[0]))
+
+    def link(self, user_id, friend_ids):
+        # Called with the lock held, like unlink
+        self.changed[user_id] = set(self.friends_of(user_id)) | set(friend_ids)
+
+    def unlink(self, user_id, friend_ids):
+        self.changed[user_id] = set(self.friends_of(user_id)) - set(friend_ids)
+
+    def nbytes(self):
+        """Approximate memory held: the arrays plus the overlay's sets."""
+        if self.state is None:
+            return 0
+        overlay = sys.getsizeof(self.changed) + sum(sys.getsizeof(friends) for friends in self.changed.values())
+        return self.state.nbytes() + overlay
+
+    def stats(self):
+        with self.lock:
+            self.refresh()
+            return {
+                'users': len(self.state.user_ids),
+                'edges': len(self.state.friend_ids),  # Both directions of every friendship
+                'changed_users': len(self.changed),
+                'bytes': self.nbytes(),
+            }
+
+    def reset(self):
+        """Forget the loaded graph, e.g. after the database was replaced."""
+        with self.lock:
+            self.state = None
+            self.changed.clear()
+
+
+friend_graph = FriendGraph()
+
+
+def rebuild():
+    """
+    Make every worker reload its graph on its next use. Returns False when
+    the cache is per-process, which leaves the other workers' graphs to
+    ``FRIEND_GRAPH_MAX_AGE``.
+    """
+    bump(GRAPH_VERSION)
+    return shared_cache()
+
+
+@receiver(m2m_changed, sender=Friendship)
+def update_friend_graph(sender, instance, action, pk_set, **kwargs):
+    with friend_graph.lock:
+        if friend_graph.state is None:
+            return
+        if action == 'post_add':
+            friend_graph.link(instance.id, pk_set)
+            for friend_id in pk_set:
+                friend_graph.link(friend_id, [instance.id])
+        elif action in ('post_remove', 'pre_clear'):
+            # A clear's pk_set is empty; its friends are still in the graph before it runs
+            friend_ids = pk_set if action == 'post_remove' else set(friend_graph.friends_of(instance.id))
+            friend_graph.unlink(instance.id, friend_ids)
+            for friend_id in friend_ids:
+                friend_graph.unlink(friend_id, [instance.id])
+
+
+@receiver(post_delete, sender=CustomUser)
+def drop_friend_graph_node(sender, instance, **kwargs):
+    # The cascade deletes the friendships without any m2m_changed signal
+    with friend_graph.lock:
+        if friend_graph.state is None:
+            return
+        for friend_id in list(friend_graph.friends_of(instance.id)):
+            friend_graph.unlink(friend_id, [instance.id])
+        friend_graph.changed[instance.id] = set()
@@ -0,0 +1,289 @@
+import json
+import random
+import time
+import tracemalloc
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from api.matching import BACKENDS
+from api.autocomplete import hobby_prefixes
+from api.graph import friend_graph
+from api.minhash import lsh_index
+from api.models import CustomUser, Hobby
+from api.sparse import hobby_matrix
+from api.weights import hobby_weights
+
+# Every request is timed against a throwaway in-memory cache
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+def top_users_body(rng, names):
+    min_age = rng.randint(18, 35)
+    return {'min_age': min_age, 'max_age': min_age + rng.randint(5, 30)}
+
+
+def update_hobbies_body(rng, names):
+    return {'hobbies': [{'name': name} for name in rng.sample(names, rng.randint(1, 6))]}
+
+
+# name -> (method, path, JSON body factory). Routes that write run last, so
+# they don't change the data the read routes are measured against.
+ROUTES = {
+    'currentuser/': ('get', '/currentuser/', None),
+    'all-hobbies/': ('get', '/all-hobbies/', None),
+    'hobbies/search': ('get', '/hobbies/search?q=s', None),
+    'get-friends/': ('get', '/get-friends/', None),
+    'friends/': ('get', '/friends/?include_total=1', None),
+    'friends-of-friends/': ('get', '/friends-of-friends/', None),
+    'get-friend-requests/': ('get', '/get-friend-requests/', None),
+    'friend-requests/count/': ('get', '/friend-requests/count/', None),
+    'threads/': ('get', '/threads/', None),
+    'threads/search': ('get', '/threads/search?q=new+tra', None),
+    'feed/': ('get', '/feed/', None),
+    'top-users/': ('post', '/top-users/', top_users_body),
+    'updatehobbies/': ('post', '/updatehobbies/', update_hobbies_body),
+}
+
+# Most SQL queries (per request) and milliseconds (95th percentile) a route
+# may take on any dataset size. Query counts include the session and user
+# lookups made by the auth middleware.
+BUDGETS = {
+    'currentuser/': {'queries': 3, 'p95_ms': 50},
+    'all-hobbies/': {'queries': 3, 'p95_ms': 100},
+    'hobbies/search': {'queries': 3, 'p95_ms': 20},
+    'get-friends/': {'queries': 3, 'p95_ms': 100},
+    'friends/': {'queries': 4, 'p95_ms': 50},
+    'friends-of-friends/': {'queries': 4, 'p95_ms': 50},  # Includes the first request's graph load
+    'get-friend-requests/': {'queries': 3, 'p95_ms': 100},
+    'friend-requests/count/': {'queries': 3, 'p95_ms': 50},
+    'threads/': {'queries': 3, 'p95_ms': 100},
+    'threads/search': {'queries': 3, 'p95_ms': 100},
+    'feed/': {'queries': 4, 'p95_ms': 100},
+    'top-users/': {'queries': 12, 'p95_ms': 1000},
+    'updatehobbies/': {'queries': 50, 'p95_ms': 1000},
+}
+
+
+class CountingCursor:
+    """Wraps a DB-API cursor and counts the rows fetched through it."""
+
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        for row in self.cursor:
+            self.counter[0] += 1
+            yield row
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.counter[0] += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        self.counter[0] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.counter[0] += len(rows)
+        return rows
+
+
+class RowCounter:
+    """``connection.execute_wrapper`` counting every row read by the ORM."""
+
+    def __init__(self):
+        self.counter = [0]
+
+    def __call__(self, execute, sql, params, many, context):
+        wrapper = context['cursor']
+        if not isinstance(wrapper.cursor, CountingCursor):
+            wrapper.cursor = CountingCursor(wrapper.cursor, self.counter)
+        return execute(sql, params, many, context)
+
+    @property
+    def rows(self):
+        return self.counter[0]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def forget_worker_state():
+    # The per-worker indexes would otherwise describe the previous dataset
+    hobby_weights.reset()
+    hobby_prefixes.reset()
+    hobby_matrix.reset()
+    lsh_index.reset()
+    friend_graph.reset()
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed throwaway databases of several sizes and measure latency, SQL queries, rows fetched "
+        "and peak memory of the api routes, failing when a route is over its budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,3000', help="Comma separated user counts.")
+        parser.add_argument('--requests', type=int, default=30, help="Timed requests per route and size.")
+        parser.add_argument('--memory-requests', type=int, default=3, help="Extra requests traced for peak memory.")
+        parser.add_argument('--routes', help="Comma separated subset of the routes.")
+        parser.add_argument('--backend', choices=sorted(BACKENDS), default=settings.HOBBY_MATCH_BACKEND)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="JSON file of an earlier run to compare against.")
+        parser.add_argument('--no-budgets', action='store_true', help="Report only; never fail on budgets.")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes must look like 1000,5000")
+        routes = options['routes'].split(',') if options['routes'] else list(ROUTES)
+        unknown = set(routes) - set(ROUTES)
+        if unknown:
+            raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        results = {
+            'created_at': timezone.now().isoformat(),
+            'backend': options['backend'],
+            'requests': options['requests'],
+            'sizes': {},
+        }
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES, HOBBY_MATCH_BACKEND=options['backend']):
+                for size in sizes:
+                    results['sizes'][str(size)] = self.run_size(size, routes, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            forget_worker_state()
+
+        self.report(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        failures = [] if options['no_budgets'] else self.over_budget(results)
+        if failures:
+            raise CommandError("Over budget:\n" + "\n".join(failures))
+
+    def run_size(self, size, routes, options):
+        call_command('flush', interactive=False, verbosity=0)
+        forget_worker_state()
+        started = time.monotonic()
+        # Runs under the benchmarked HOBBY_MATCH_BACKEND, so the table backend gets its similarity rows
+        call_command('seed_scale', users=size, seed=options['seed'], stdout=StringIO())
+        self.stdout.write(f"Seeded {size} users in {time.monotonic() - started:.1f}s")
+
+        rng = random.Random(options['seed'])
+        names = list(Hobby.objects.values_list('name', flat=True))
+        user_ids = list(CustomUser.objects.values_list('id', flat=True))
+        total = options['requests'] + options['memory_requests']
+        return {
+            route: self.run_route(route, rng, names, rng.sample(user_ids, min(total, len(user_ids))), options)
+            for route in routes
+        }
+
+    def request(self, route, rng, names, user_id):
+        method, path, body = ROUTES[route]
+        client = Client()
+        # Logging in happens outside the measured part
+        client.force_login(CustomUser.objects.get(id=user_id))
+        kwargs = {}
+        if body is not None:
+            kwargs = {'data': json.dumps(body(rng, names)), 'content_type': 'application/json'}
+        return lambda: getattr(client, method)(path, **kwargs)
+
+    def run_route(self, route, rng, names, user_ids, options):
+        latencies, queries, rows, errors = [], [], [], 0
+        for user_id in user_ids[:options['requests']]:
+            send = self.request(route, rng, names, user_id)
+            counter = RowCounter()
+            # The query log is bounded; an earlier full log would hide this request's queries
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured, connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                response = send()
+                latencies.append(time.perf_counter() - started)
+            queries.append(len(captured))
+            rows.append(counter.rows)
+            errors += response.status_code >= 400
+
+        # Tracing slows everything down, so memory is measured on separate requests
+        peaks = []
+        for user_id in user_ids[options['requests']:]:
+            send = self.request(route, rng, names, user_id)
+            tracemalloc.start()
+            try:
+                send()
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+
+        return {
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'queries': max(queries),
+            'rows': max(rows),
+            'peak_kib': round(max(peaks) / 1024) if peaks else None,
+            'errors': errors,
+        }
+
+    def report(self, results, baseline):
+        self.stdout.write(
+            f"{'users':>7} {'route':<22} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'queries':>7} {'rows':>8} {'peak KiB':>8}" + (f" {'p95 was':>8} {'queries was':>11}" if baseline else "")
+        )
+        for size, routes in results['sizes'].items():
+            for route, stats in routes.items():
+                line = (
+                    f"{size:>7} {route:<22} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} "
+                    f"{stats['queries']:>7} {stats['rows']:>8} {stats['peak_kib'] or '-':>8}"
+                )
+                if baseline:
+                    before = baseline['sizes'].get(size, {}).get(route)
+                    if before:
+                        line += f" {before['p95_ms']:>8.2f} {before['queries']:>11}"
+                self.stdout.write(line)
+
+    def over_budget(self, results):
+        failures = []
+        for size, routes in results['sizes'].items():
+            for route, stats in routes.items():
+                budget = BUDGETS[route]
+                if stats['errors']:
+                    failures.append(f"{route} at {size} users: {stats['errors']} error responses")
+                if stats['queries'] > budget['queries']:
+                    failures.append(f"{route} at {size} users: {stats['queries']} queries, budget {budget['queries']}")
+                if stats['p95_ms'] > budget['p95_ms']:
+                    failures.append(f"{route} at {size} users: p95 {stats['p95_ms']} ms, budget {budget['p95_ms']} ms")
+        return failures
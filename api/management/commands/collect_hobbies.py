@@ -0,0 +1,58 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Hobby
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete hobbies that no user has had for longer than the grace period. Unused hobbies are "
+        "first marked, so one that is dropped and picked again soon keeps its id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=settings.HOBBY_GC_GRACE, help="Seconds a hobby must stay unused.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Hobbies checked per statement.")
+        parser.add_argument('--loop', action='store_true', help="Keep running, starting a new pass every --interval seconds.")
+        parser.add_argument('--interval', type=int, default=3600)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['grace'] < 0:
+            raise CommandError("--batch-size must be positive and --grace not negative.")
+        while True:
+            started = time.monotonic()
+            self.run_pass(options)
+            if not options['loop']:
+                return
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
+
+    def run_pass(self, options):
+        now = timezone.now()
+        expired = now - timedelta(seconds=options['grace'])
+        marked = unmarked = deleted = 0
+        last_id = 0
+        while True:
+            # Walk the table in id ranges so every statement stays small
+            ids = list(
+                Hobby.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            batch = Hobby.objects.filter(id__range=(ids[0], last_id))
+            # Anti-join: hobbies without a single user row
+            unused = batch.filter(users__isnull=True)
+            with transaction.atomic():
+                unmarked += batch.filter(unused_since__isnull=False, users__isnull=False).update(unused_since=None)
+                marked += unused.filter(unused_since__isnull=True).update(unused_since=now)
+                # The anti-join is checked again here, so a hobby picked up since it was marked survives
+                deleted += unused.filter(unused_since__lte=expired).delete()[1].get(Hobby._meta.label, 0)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Marked {marked} unused hobbies, unmarked {unmarked} used again, deleted {deleted}"
+        ))
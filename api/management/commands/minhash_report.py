@@ -0,0 +1,105 @@
+import heapq
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.minhash import MinHashIndex
+
+
+def top_ten(scores):
+    return heapq.nsmallest(10, scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def recall(approximate, exact):
+    """Share of the exact top ten matched by the approximate one, counting ties as hits."""
+    if not exact:
+        return 1.0
+    cutoff = exact[-1][1]
+    return sum(1 for _, score in approximate if score >= cutoff) / len(exact)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Command(BaseCommand):
+    help = "Compare recall and latency of the MinHash LSH backend against exact matching on synthetic data."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50000)
+        parser.add_argument('--hobbies', type=int, default=1000, help="Size of the hobby vocabulary.")
+        parser.add_argument('--max-hobbies', type=int, default=8, help="Most hobbies a single user has.")
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--configs', default='8x1,16x1,32x1,16x2,32x2', help="Comma separated BANDSxROWS layouts.")
+        parser.add_argument('--max-candidates', type=int, default=settings.HOBBY_LSH_MAX_CANDIDATES)
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        try:
+            configs = [tuple(int(n) for n in config.split('x')) for config in options['configs'].split(',')]
+        except ValueError:
+            raise CommandError("--configs must look like 16x1,32x2")
+
+        rng = random.Random(options['seed'])
+        # Zipf distributed hobby popularity: a few hobbies are shared by most users
+        vocabulary = range(1, options['hobbies'] + 1)
+        cum_weights = []
+        total = 0.0
+        for rank in vocabulary:
+            total += 1 / rank
+            cum_weights.append(total)
+        users = {
+            user_id: set(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(1, options['max_hobbies'])))
+            for user_id in range(1, options['users'] + 1)
+        }
+        postings = defaultdict(list)
+        for user_id, hobby_ids in users.items():
+            for hobby_id in hobby_ids:
+                postings[hobby_id].append(user_id)
+        queries = rng.sample(sorted(users), min(options['queries'], len(users)))
+
+        exact, latencies = {}, []
+        for user_id in queries:
+            started = time.perf_counter()
+            scores = Counter()
+            for hobby_id in users[user_id]:
+                scores.update(postings[hobby_id])
+            del scores[user_id]
+            exact[user_id] = top_ten(scores)
+            latencies.append(time.perf_counter() - started)
+
+        self.stdout.write(
+            f"{options['users']} users, {options['hobbies']} hobbies, {len(queries)} queries, "
+            f"at most {options['max_candidates']} candidates"
+        )
+        self.stdout.write(f"{'layout':>8} {'build s':>8} {'entries':>10} {'candidates':>10} {'p50 ms':>8} {'p95 ms':>8} {'recall@10':>9}")
+        self.row('exact', 0, 0, 0, latencies, 1.0)
+
+        for bands, rows in configs:
+            started = time.perf_counter()
+            index = MinHashIndex(bands, rows, seed=options['seed'])
+            for user_id, hobby_ids in users.items():
+                index.add(user_id, hobby_ids)
+            build = time.perf_counter() - started
+
+            latencies, recalls, candidate_counts = [], [], []
+            for user_id in queries:
+                started = time.perf_counter()
+                candidates = index.candidates(users[user_id], options['max_candidates'], exclude={user_id})
+                scores = {other: len(users[user_id] & users[other]) for other in candidates}
+                approximate = top_ten({other: score for other, score in scores.items() if score})
+                latencies.append(time.perf_counter() - started)
+                recalls.append(recall(approximate, exact[user_id]))
+                candidate_counts.append(len(candidates))
+            self.row(f'{bands}x{rows}', build, index.size(), statistics.mean(candidate_counts), latencies, statistics.mean(recalls))
+
+    def row(self, layout, build, entries, candidates, latencies, recall_at_ten):
+        self.stdout.write(
+            f"{layout:>8} {build:>8.1f} {entries:>10} {candidates:>10.0f} "
+            f"{percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.95) * 1000:>8.2f} {recall_at_ten:>9.2f}"
+        )
@@ -0,0 +1,108 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from api.precompute import active_users, compute, store
+from api.weights import SIMILARITIES
+
+
+def init_worker():
+    # Processes started with "spawn" begin without Django set up
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+        django.setup()
+
+
+def read_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['last_user_id']
+    except FileNotFoundError:
+        return 0
+    except (KeyError, ValueError):
+        raise CommandError(f"Checkpoint file {path} is not valid.")
+
+
+def write_checkpoint(path, last_user_id):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump({'last_user_id': last_user_id}, f)
+    os.replace(temporary, path)
+
+
+class Command(BaseCommand):
+    help = "Precompute the top_users candidates of every active user into the Recommendation table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help="Users scored per task.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Most worker processes.")
+        parser.add_argument('--top', type=int, default=100, help="Candidates stored per user.")
+        parser.add_argument('--similarity', choices=SIMILARITIES, default=settings.HOBBY_MATCH_SIMILARITY)
+        parser.add_argument('--active-days', type=int, help="Only users who logged in or joined within this many days.")
+        parser.add_argument('--checkpoint', help="File recording progress; an interrupted pass resumes from it.")
+        parser.add_argument('--loop', action='store_true', help="Keep running, starting a new pass every --interval seconds.")
+        parser.add_argument('--interval', type=int, default=3600)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--chunk-size and --workers must be positive.")
+        while True:
+            started = time.monotonic()
+            self.run_pass(options)
+            if not options['loop']:
+                return
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
+
+    def run_pass(self, options):
+        checkpoint = options['checkpoint']
+        start_after = read_checkpoint(checkpoint) if checkpoint else 0
+        since = timezone.now() - timedelta(days=options['active_days']) if options['active_days'] else None
+        user_ids = list(
+            active_users(since).filter(id__gt=start_after).order_by('id').values_list('id', flat=True)
+        )
+        if start_after:
+            self.stdout.write(f"Resuming after user {start_after}")
+        chunks = [user_ids[i:i + options['chunk_size']] for i in range(0, len(user_ids), options['chunk_size'])]
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        started = time.monotonic()
+        done = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as executor:
+            pending = deque()
+            chunk_iter = iter(chunks)
+            # Keep a bounded number of tasks in flight and consume them in
+            # order, so the checkpoint never skips an unfinished chunk
+            for chunk in chunk_iter:
+                pending.append((chunk, executor.submit(compute, chunk, options['similarity'], options['top'])))
+                if len(pending) >= options['workers'] * 2:
+                    break
+            while pending:
+                chunk, future = pending.popleft()
+                store(future.result(), options['similarity'])
+                done += len(chunk)
+                if checkpoint:
+                    write_checkpoint(checkpoint, chunk[-1])
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"{done}/{len(user_ids)} users, {done / elapsed:.0f} users/sec")
+                next_chunk = next(chunk_iter, None)
+                if next_chunk is not None:
+                    pending.append((next_chunk, executor.submit(compute, next_chunk, options['similarity'], options['top'])))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Precomputed {done} users in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.0f} users/sec)"
+        ))
+        if checkpoint:
+            # The pass is complete; the next one starts from the beginning
+            write_checkpoint(checkpoint, 0)
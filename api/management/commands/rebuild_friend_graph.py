@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import graph
+
+
+class Command(BaseCommand):
+    help = "Make every worker reload its in-memory friend graph (needs a shared cache), and report the graph's size."
+
+    def handle(self, *args, **options):
+        if not graph.rebuild():
+            self.stdout.write(self.style.WARNING(
+                f"The cache is per-process, so running workers reload their graph only once it is "
+                f"FRIEND_GRAPH_MAX_AGE ({settings.FRIEND_GRAPH_MAX_AGE}s) old. Set CACHE_BACKEND to reload them now."
+            ))
+        # Loads a fresh copy here, to measure it
+        stats = graph.friend_graph.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Friend graph: {stats['users']} users, {stats['edges']} edges, {stats['bytes'] / 1024:.0f} KiB per worker"
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api import similarity
+from api.models import UserSimilarity
+
+
+class Command(BaseCommand):
+    help = "Recompute the UserSimilarity table used by the table backend from everyone's hobbies."
+
+    def handle(self, *args, **options):
+        similarity.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"User similarity rebuilt: {UserSimilarity.objects.count()} pairs"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import fulltext
+
+
+class Command(BaseCommand):
+    help = "Recreate the thread full-text index if it is missing and reindex every thread."
+
+    def handle(self, *args, **options):
+        if not fulltext.supported():
+            raise CommandError("Full-text search needs SQLite or PostgreSQL.")
+        fulltext.install()
+        self.stdout.write(self.style.SUCCESS("Thread search index rebuilt"))
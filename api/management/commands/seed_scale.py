@@ -0,0 +1,203 @@
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import date, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api import feed, similarity, weights
+from api.models import CustomUser, FriendRequest, Friendship, Hobby, Thread, normalize_hobby_name
+
+UserHobby = CustomUser.hobbies.through
+
+BASE_HOBBIES = [
+    'Reading', 'Running', 'Swimming', 'Gym', 'Football', 'Tennis', 'Cooking', 'Hiking', 'Photography',
+    'Painting', 'Drawing', 'Gaming', 'Chess', 'Cycling', 'Yoga', 'Guitar', 'Piano', 'Singing', 'Dancing',
+    'Gardening', 'Fishing', 'Climbing', 'Skiing', 'Surfing', 'Knitting', 'Baking', 'Writing', 'Coding',
+    'Travel', 'Films', 'Basketball', 'Volleyball', 'Golf', 'Boxing', 'Martial Arts', 'Board Games',
+    'Podcasts', 'Birdwatching', 'Pottery', 'Astronomy',
+]
+
+WORDS = (
+    'today I tried a new trail and the view was amazing anyone up for a game this weekend '
+    'just finished a great book looking for recommendations practice makes perfect'
+).split()
+
+
+@contextmanager
+def explicit_created_at():
+    # bulk_create would otherwise stamp every thread with the same time
+    field = Thread._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = "Fill the database with a large, deterministic synthetic dataset for load and benchmark work."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--hobbies', type=int, default=500, help="Size of the hobby vocabulary.")
+        parser.add_argument('--max-hobbies', type=int, default=8, help="Most hobbies a single user has.")
+        parser.add_argument('--friends', type=int, default=10, help="Average friends per user.")
+        parser.add_argument('--requests', type=int, default=2, help="Average pending friend requests per user.")
+        parser.add_argument('--threads', type=int, default=3, help="Average threads per user.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='seed', help="Username prefix; use a new one to add more users.")
+        parser.add_argument('--password', default='password', help="Password shared by every generated user.")
+        parser.add_argument(
+            '--with-similarity', action='store_true',
+            help=(
+                "Also rebuild the UserSimilarity table, which grows quadratically with popular hobbies. "
+                "Always done when HOBBY_MATCH_BACKEND is 'table', which reads it."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if CustomUser.objects.filter(username__startswith=f"{options['prefix']}_").exists():
+            raise CommandError(f"Users prefixed {options['prefix']}_ already exist; pass another --prefix.")
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+
+        with transaction.atomic():
+            hobby_ids = self.step("hobbies", self.create_hobbies, options['hobbies'])
+            user_ids = self.step("users", self.create_users, options)
+            self.step("hobby memberships", self.create_memberships, user_ids, hobby_ids, options['max_hobbies'])
+            self.step("friendships", self.create_friendships, user_ids, options['friends'])
+            self.step("friend requests", self.create_friend_requests, user_ids, options['requests'])
+            self.step("threads", self.create_threads, user_ids, options['threads'])
+            self.step("hobby counters", weights.rebuild)
+            self.step("timelines", feed.rebuild)
+            if options['with_similarity'] or settings.HOBBY_MATCH_BACKEND == 'table':
+                self.step("user similarity", similarity.rebuild)
+        # Cached recommendations and version counters predate the new data
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS(f"Seeded {len(user_ids)} users in {time.monotonic() - started:.1f}s"))
+
+    def step(self, name, function, *args):
+        started = time.monotonic()
+        result = function(*args)
+        self.stdout.write(f"{name}: {time.monotonic() - started:.1f}s")
+        return result
+
+    def insert(self, model, rows):
+        """Insert ``rows``, any iterable, one batch at a time, so only a batch is ever in memory."""
+        rows = iter(rows)
+        while batch := list(islice(rows, self.batch_size)):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def create_hobbies(self, count):
+        names = [
+            BASE_HOBBIES[i] if i < len(BASE_HOBBIES) else f"{BASE_HOBBIES[i % len(BASE_HOBBIES)]} {i // len(BASE_HOBBIES)}"
+            for i in range(count)
+        ]
+        # Names already in the vocabulary are skipped by the unique normalized_name
+        self.insert(Hobby, (Hobby(name=name, normalized_name=normalize_hobby_name(name)) for name in names))
+        by_name = dict(
+            Hobby.objects.filter(normalized_name__in=[normalize_hobby_name(name) for name in names]).values_list('normalized_name', 'id')
+        )
+        # Popularity rank follows the order of the names
+        return [by_name[normalize_hobby_name(name)] for name in names]
+
+    def create_users(self, options):
+        password = make_password(options['password'])
+        today = date.today()
+        prefix = options['prefix']
+
+        def users():
+            for i in range(options['users']):
+                # Ages cluster around the late twenties, between 16 and 80
+                age_days = int(min(max(self.rng.gauss(29, 9), 16), 80) * 365.25)
+                yield CustomUser(
+                    username=f"{prefix}_{i}",
+                    email=f"{prefix}_{i}@example.com",
+                    password=password,
+                    first_name=f"First{i}",
+                    last_name=f"Last{i}",
+                    date_of_birth=today - timedelta(days=age_days),
+                )
+
+        self.insert(CustomUser, users())
+        user_ids = CustomUser.objects.filter(username__startswith=f"{prefix}_").order_by('id').values_list('id', flat=True)
+        return array('q', user_ids.iterator(chunk_size=self.batch_size))
+
+    def create_memberships(self, user_ids, hobby_ids, max_hobbies):
+        # Zipf distributed popularity: the first hobbies are shared by most users
+        cum_weights = []
+        total = 0.0
+        for rank in range(1, len(hobby_ids) + 1):
+            total += 1 / rank
+            cum_weights.append(total)
+
+        def rows():
+            for user_id in user_ids:
+                picks = set(self.rng.choices(hobby_ids, cum_weights=cum_weights, k=self.rng.randint(1, max_hobbies)))
+                yield from (UserHobby(customuser_id=user_id, hobby_id=hobby_id) for hobby_id in picks)
+
+        self.insert(UserHobby, rows())
+
+    def random_pairs(self, user_ids, average, parity):
+        """
+        Distinct unordered pairs of users, about ``average`` per user.
+
+        User ``i`` is paired with users ``i + d`` (modulo the number of users)
+        for a few distinct offsets ``d`` of the given ``parity``, all at most
+        half the number of users. Every pair then has a single ``(i, d)``, so
+        no pair comes out twice and odd and even offsets never share a pair,
+        without remembering the pairs made so far.
+        """
+        count = len(user_ids)
+        offsets = range(2 - parity, (count - 1) // 2 + 1, 2)
+        for i, user_id in enumerate(user_ids):
+            k = min(self.rng.randint(0, round(2 * average)), len(offsets))
+            for offset in self.rng.sample(offsets, k):
+                yield user_id, user_ids[(i + offset) % count]
+
+    def create_friendships(self, user_ids, average):
+        def rows():
+            # The relation is symmetrical: both directions are stored
+            for a, b in self.random_pairs(user_ids, average / 2, parity=1):
+                yield Friendship(user_id=a, friend_id=b)
+                yield Friendship(user_id=b, friend_id=a)
+
+        self.insert(Friendship, rows())
+
+    def create_friend_requests(self, user_ids, average):
+        def requests():
+            # Even offsets, so never between two friends
+            for a, b in self.random_pairs(user_ids, average, parity=0):
+                if self.rng.random() < 0.5:
+                    a, b = b, a
+                yield FriendRequest(from_user_id=a, to_user_id=b)
+
+        self.insert(FriendRequest, requests())
+
+    def create_threads(self, user_ids, average):
+        count = len(user_ids) * average
+        span = 365 * 24 * 3600
+        start = timezone.now() - timedelta(seconds=span)
+
+        def threads():
+            # One random time per equal slot of the year, so threads come out
+            # oldest first and ids grow with created_at, like real posts
+            for i in range(count):
+                yield Thread(
+                    user_id=self.rng.choice(user_ids),
+                    content=' '.join(self.rng.choices(WORDS, k=self.rng.randint(5, 30))),
+                    created_at=start + timedelta(seconds=(i + self.rng.random()) * span / count),
+                )
+
+        with explicit_created_at():
+            self.insert(Thread, threads())
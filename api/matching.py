@@ -0,0 +1,473 @@
+"""
+Hobby based matching used by the ``top_users`` view.
+
+The backend is selected with ``settings.HOBBY_MATCH_BACKEND``:
+
+``table``
+    Reads the materialized ``UserSimilarity`` rows kept up to date by
+    api/similarity.py, so a page is an indexed ORDER BY ... LIMIT.
+``index``
+    Scores candidates from an inverted index (hobby id -> sorted array of
+    user ids) built only for the requester's hobbies, so users who share no
+    hobby with the requester are never loaded.
+``sparse``
+    Scores everyone with one sparse matrix-vector product over a per-worker
+    users x hobbies matrix, see api/sparse.py. Needs numpy and scipy.
+``minhash``
+    Approximate: only users sharing an LSH bucket with the requester are
+    scored, see api/minhash.py. Also used for requests asking for
+    ``approximate`` results.
+``precomputed``
+    Reads the best matches stored by the precompute_recommendations
+    command, so only the age filter runs per request. Pages the stored
+    list cannot fill in a narrow age band are ranked like ``index``.
+
+Every backend except ``table`` can rank by any of the similarities in
+``SIMILARITIES``: the number of shared hobbies (``count``), the Jaccard index
+of the two hobby sets (``jaccard``), or the sum of the IDF weights of the
+shared hobbies (``idf``), which favours rare hobbies over popular ones.
+
+Whatever the backend, the requester's friends and the users they have a
+pending friend request with are left out, and friends of friends are
+blended in by ``FriendsOfFriends``: each mutual friend adds as much to a
+candidate's score as ``TOP_USERS_MUTUAL_FRIEND_WEIGHT`` shared hobbies.
+"""
+import heapq
+from array import array
+from collections import Counter
+from datetime import MAXYEAR, MINYEAR, date, timedelta
+from itertools import chain, groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import Q
+
+from .graph import friend_graph
+from .models import CustomUser, FriendRequest, Friendship, Recommendation, UserSimilarity
+from .minhash import lsh_index
+from .pagination import decode_cursor, encode_cursor
+from .similarity import chunked
+from .sparse import SparseRanking
+from .weights import SCORE_DIGITS, SIMILARITIES, hobby_weights, jaccard
+
+UserHobby = CustomUser.hobbies.through
+
+PAGE_SIZE = 10
+
+
+def years_before(day, years):
+    year = day.year - years
+    if year < MINYEAR:
+        return date.min
+    if year > MAXYEAR:
+        return date.max
+    try:
+        return day.replace(year=year)
+    except ValueError:
+        # 29 February in a non-leap year
+        return day.replace(year=year, day=28)
+
+
+def birth_date_range(min_age, max_age, today=None):
+    """
+    Turn an inclusive age window into an inclusive ``date_of_birth`` range,
+    so the filter can run in SQL against the date_of_birth index.
+    """
+    today = today or date.today()
+    latest = years_before(today, min_age)
+    earliest = years_before(today, max_age + 1)
+    if earliest != date.min:
+        # Someone born exactly max_age + 1 years ago is already too old
+        earliest += timedelta(days=1)
+    return earliest, latest
+
+
+class HobbyIndex:
+    """Posting lists mapping a hobby id to the sorted ids of its users."""
+
+    def __init__(self, postings, sizes):
+        self.postings = postings
+        self.sizes = sizes  # user id -> number of hobbies, for the jaccard similarity
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from ``(hobby_id, user_id, hobby_count)`` rows sorted by hobby then user."""
+        postings, sizes = {}, {}
+        for hobby_id, members in groupby(rows, key=itemgetter(0)):
+            user_ids = postings[hobby_id] = array('q')
+            for _, user_id, hobby_count in members:
+                user_ids.append(user_id)
+                sizes[user_id] = hobby_count
+        return cls(postings, sizes)
+
+    @classmethod
+    def for_hobbies(cls, hobby_ids, birth_dates):
+        # One query over the hobby/user through table; only members of the
+        # requested hobbies born inside ``birth_dates`` come back.
+        rows = (
+            UserHobby.objects
+            .filter(hobby_id__in=hobby_ids, customuser__date_of_birth__range=birth_dates)
+            .order_by('hobby_id', 'customuser_id')
+            .values_list('hobby_id', 'customuser_id', 'customuser__hobby_count')
+        )
+        return cls.from_rows(rows.iterator())
+
+    def common_counts(self, exclude=()):
+        """Merge the posting lists and count how many of them each user is in."""
+        counts = {}
+        for user_id, hits in groupby(heapq.merge(*self.postings.values())):
+            if user_id not in exclude:
+                counts[user_id] = sum(1 for _ in hits)
+        return counts
+
+    def weighted_scores(self, weights, exclude=()):
+        """Sum the weights of the hobbies each user shares."""
+        scores = {}
+        for hobby_id, user_ids in self.postings.items():
+            weight = weights[hobby_id]
+            for user_id in user_ids:
+                scores[user_id] = scores.get(user_id, 0) + weight
+        return {
+            user_id: round(score, SCORE_DIGITS)
+            for user_id, score in scores.items()
+            if user_id not in exclude
+        }
+
+    def scores(self, similarity, hobby_ids, exclude=()):
+        if similarity == 'idf':
+            return self.weighted_scores(hobby_weights.idf(hobby_ids), exclude)
+        counts = self.common_counts(exclude)
+        if similarity == 'jaccard':
+            return {
+                user_id: jaccard(count, len(hobby_ids), self.sizes[user_id])
+                for user_id, count in counts.items()
+            }
+        return counts
+
+
+def rank_key(item):
+    user_id, score = item
+    return -score, user_id
+
+
+class ScoreRanking:
+    """Ranks a ``scores`` dict of user id -> score computed in memory."""
+
+    similarities = SIMILARITIES
+
+    def exclude(self, connected, candidates):
+        """
+        Drop ``connected``, the requester and the users they are friends or
+        have a pending request with, and the friends-of-friends
+        ``candidates`` blended in separately.
+        """
+        for user_id in chain(connected, candidates):
+            self.scores.pop(user_id, None)
+
+    def count(self):
+        return len(self.scores)
+
+    def top(self, limit, after=None):
+        # A bounded heap keeps only ``limit`` candidates instead of sorting everyone
+        items = self.scores.items()
+        if after is not None:
+            bound = rank_key(after)
+            items = (item for item in items if rank_key(item) > bound)
+        return heapq.nsmallest(limit, items, key=rank_key)
+
+
+class IndexRanking(ScoreRanking):
+    """Ranks the requester's matches from a ``HobbyIndex``."""
+
+    def __init__(self, user, hobby_ids, birth_dates, similarity):
+        index = HobbyIndex.for_hobbies(hobby_ids, birth_dates)
+        self.scores = index.scores(similarity, hobby_ids, exclude={user.id})
+
+
+class ApproximateRanking(ScoreRanking):
+    """
+    Ranks only the users colliding with the requester in the MinHash LSH
+    buckets of api/minhash.py, re-scored exactly from the database.
+    """
+
+    def __init__(self, user, hobby_ids, birth_dates, similarity):
+        candidates = lsh_index.get().candidates(hobby_ids, settings.HOBBY_LSH_MAX_CANDIDATES, exclude={user.id})
+        rows = []
+        for chunk in chunked(candidates):
+            rows.extend(
+                UserHobby.objects
+                .filter(customuser_id__in=chunk, hobby_id__in=hobby_ids, customuser__date_of_birth__range=birth_dates)
+                .values_list('hobby_id', 'customuser_id', 'customuser__hobby_count')
+            )
+        rows.sort()
+        self.scores = HobbyIndex.from_rows(rows).scores(similarity, hobby_ids)
+
+
+class TableRanking:
+    """Ranks the requester's matches from the materialized ``UserSimilarity`` rows."""
+
+    # Only plain counts are materialized; other similarities use IndexRanking
+    similarities = ('count',)
+
+    def __init__(self, user, hobby_ids, birth_dates, similarity):
+        self.user = user
+        self.queryset = (
+            UserSimilarity.objects
+            .filter(user_a=user, user_b__date_of_birth__range=birth_dates)
+            .order_by('-common_hobby_count', 'user_b_id')
+            .values_list('user_b_id', 'common_hobby_count')
+        )
+
+    def exclude(self, connected, candidates):
+        # Friends and pending requests can number in the thousands, more ids
+        # than one statement may bind, so they are left out by subqueries.
+        # Only the friends of friends, at most TOP_USERS_FOF_CANDIDATES, are listed.
+        pending = FriendRequest.objects.filter(status='pending')
+        self.queryset = (
+            self.queryset
+            .exclude(user_b_id__in=Friendship.objects.filter(user=self.user).values('friend_id'))
+            .exclude(user_b_id__in=pending.filter(from_user=self.user).values('to_user_id'))
+            .exclude(user_b_id__in=pending.filter(to_user=self.user).values('from_user_id'))
+        )
+        if candidates:
+            self.queryset = self.queryset.exclude(user_b_id__in=sorted(candidates))
+
+    def count(self):
+        return self.queryset.count()
+
+    def top(self, limit, after=None):
+        queryset = self.queryset
+        if after is not None:
+            user_id, score = after
+            queryset = queryset.filter(
+                Q(common_hobby_count__lt=score) | Q(common_hobby_count=score, user_b_id__gt=user_id)
+            )
+        return list(queryset[:limit])
+
+
+class PrecomputedRanking(ScoreRanking):
+    """
+    Ranks the candidates stored in the ``Recommendation`` table by the
+    precompute_recommendations command, falling back to ``IndexRanking``
+    for users without a current list.
+
+    The stored list holds only the best ``--top`` matches of any age, so a
+    narrow age band can leave fewer of them than a page needs. Pages the
+    list can fill are served from it, since nobody missing from it ranks
+    above its last entry; the others come from ``IndexRanking`` unless the
+    list holds every match in the band. ``count`` always counts the matches
+    in the database.
+    """
+
+    def __init__(self, user, hobby_ids, birth_dates, similarity):
+        self.args = (user, hobby_ids, birth_dates, similarity)
+        self.excluded = set()
+        self.fallback = None
+        candidates = (
+            Recommendation.objects
+            .filter(user=user, similarity=similarity)
+            .values_list('candidates', flat=True)
+            .first()
+        )
+        if candidates is None:
+            self.scores = IndexRanking(*self.args).scores
+            self.stored = None
+            self.complete = True
+            return
+        in_range = set()
+        for chunk in chunked([user_id for user_id, _ in candidates]):
+            in_range.update(
+                CustomUser.objects.filter(id__in=chunk, date_of_birth__range=birth_dates)
+                .values_list('id', flat=True)
+            )
+        self.scores = {user_id: score for user_id, score in candidates if user_id in in_range}
+        self.stored = len(self.scores)
+        self.complete = None  # Whether the list holds every match in the band; checked when a page needs it
+
+    def exclude(self, connected, candidates):
+        super().exclude(connected, candidates)
+        self.excluded.update(connected, candidates)
+
+    def matches(self):
+        """The users in the age band sharing a hobby with the requester, as a values() queryset."""
+        user, hobby_ids, birth_dates, _ = self.args
+        return (
+            UserHobby.objects
+            .filter(hobby_id__in=hobby_ids, customuser__date_of_birth__range=birth_dates)
+            .exclude(customuser_id=user.id)
+            .values('customuser_id')
+            .distinct()
+        )
+
+    def count(self):
+        if self.stored is None:
+            return super().count()
+        matches = self.matches()
+        count = matches.count()
+        for chunk in chunked(sorted(self.excluded)):
+            count -= matches.filter(customuser_id__in=chunk).count()
+        return count
+
+    def top(self, limit, after=None):
+        page = super().top(limit, after)
+        if len(page) == limit:
+            return page
+        if self.complete is None:
+            self.complete = self.stored >= self.matches().count()
+        if self.complete:
+            return page
+        if self.fallback is None:
+            self.fallback = IndexRanking(*self.args)
+            self.fallback.exclude(self.excluded, ())
+        return self.fallback.top(limit, after)
+
+
+class FriendsOfFriends:
+    """
+    Candidates two steps away in the friend graph, with the users the
+    requester must not be shown. Reads a bounded part of the per-worker
+    graph (api/graph.py) and makes four queries, whatever the requester's
+    number of friends. The friends themselves come from the database: the
+    graph can be ``FRIEND_GRAPH_MAX_AGE`` old, and a friendship accepted
+    through another worker must never be recommended.
+    """
+
+    def __init__(self, user, hobby_ids, birth_dates, similarity):
+        pending = (
+            FriendRequest.objects.filter(Q(from_user=user) | Q(to_user=user), status='pending')
+            .values_list('from_user_id', 'to_user_id')
+        )
+        self.excluded = {user_id for pair in pending for user_id in pair}
+        self.excluded.update(Friendship.objects.filter(user=user).values_list('friend_id', flat=True))
+        self.excluded.add(user.id)
+
+        self.mutual = {}
+        self.common_counts = {}
+        self.scores = {}
+        limit = settings.TOP_USERS_FOF_CANDIDATES
+        if not limit:
+            return
+        candidates = dict(friend_graph.friends_of_friends(user.id, limit, settings.FRIEND_GRAPH_MAX_EDGES, self.excluded))
+        in_range = CustomUser.objects.filter(id__in=list(candidates), date_of_birth__range=birth_dates)
+        self.mutual = {user_id: candidates[user_id] for user_id in in_range.values_list('id', flat=True)}
+
+        rows = (
+            UserHobby.objects.filter(customuser_id__in=list(self.mutual), hobby_id__in=hobby_ids)
+            .order_by('hobby_id', 'customuser_id')
+            .values_list('hobby_id', 'customuser_id', 'customuser__hobby_count')
+        )
+        index = HobbyIndex.from_rows(rows.iterator())
+        hobby_scores = index.scores(similarity, hobby_ids)
+        common_counts = index.common_counts()
+        self.common_counts = {user_id: common_counts.get(user_id, 0) for user_id in self.mutual}
+        unit = self.hobby_unit(similarity, hobby_ids) * settings.TOP_USERS_MUTUAL_FRIEND_WEIGHT
+        self.scores = {
+            user_id: round(hobby_scores.get(user_id, 0) + unit * mutual, SCORE_DIGITS)
+            for user_id, mutual in self.mutual.items()
+        }
+
+    @staticmethod
+    def hobby_unit(similarity, hobby_ids):
+        """What one more shared hobby roughly adds to a score of ``similarity``."""
+        if similarity == 'jaccard':
+            return 1 / max(len(hobby_ids), 1)
+        if similarity == 'idf':
+            weights = hobby_weights.idf(hobby_ids)
+            return sum(weights.values()) / len(weights) if weights else 1
+        return 1
+
+
+class BlendedRanking(ScoreRanking):
+    """A backend's ranking merged with the scores of ``FriendsOfFriends``, which it no longer contains."""
+
+    def __init__(self, ranking, scores):
+        self.ranking = ranking
+        self.scores = scores
+
+    def count(self):
+        return self.ranking.count() + len(self.scores)
+
+    def top(self, limit, after=None):
+        return heapq.nsmallest(limit, self.ranking.top(limit, after) + super().top(limit, after), key=rank_key)
+
+
+BACKENDS = {
+    'index': IndexRanking,
+    'table': TableRanking,
+    'sparse': SparseRanking,
+    'minhash': ApproximateRanking,
+    'precomputed': PrecomputedRanking,
+}
+
+
+def page_bounds(page_number, num_pages):
+    try:
+        number = int(page_number)
+    except (TypeError, ValueError):
+        number = 1
+    return min(max(number, 1), num_pages)
+
+
+def top_users(user, min_age, max_age, page_number=1, cursor=None, backend=None, similarity=None):
+    """
+    Return ``(rows, num_pages, next_cursor)`` for one page of hobby matches.
+
+    ``similarity`` is one of ``SIMILARITIES`` and defaults to
+    ``settings.HOBBY_MATCH_SIMILARITY``. With a ``cursor`` (from a previous
+    page) the next page is read by keyset and ``num_pages`` is None, since
+    counting every match is skipped. Raises ValueError for a malformed
+    cursor or an unknown similarity.
+    """
+    similarity = similarity or settings.HOBBY_MATCH_SIMILARITY
+    if similarity not in SIMILARITIES:
+        raise ValueError("Unknown similarity.")
+    ranking_class = BACKENDS[backend or settings.HOBBY_MATCH_BACKEND]
+    if similarity not in ranking_class.similarities:
+        ranking_class = IndexRanking
+    hobby_ids = list(user.hobbies.values_list('id', flat=True))
+    birth_dates = birth_date_range(min_age, max_age)
+    ranking = ranking_class(user, hobby_ids, birth_dates, similarity)
+    friends_of_friends = FriendsOfFriends(user, hobby_ids, birth_dates, similarity)
+    ranking.exclude(friends_of_friends.excluded, friends_of_friends.scores.keys())
+    ranking = BlendedRanking(ranking, friends_of_friends.scores)
+
+    if cursor is not None:
+        score, user_id = decode_cursor(cursor, 2)
+        if not isinstance(score, (int, float)) or not isinstance(user_id, int):
+            raise ValueError("Invalid cursor.")
+        num_pages = None
+        page = ranking.top(PAGE_SIZE + 1, after=(user_id, score))
+    else:
+        num_pages = max(1, -(-ranking.count() // PAGE_SIZE))
+        number = page_bounds(page_number, num_pages)
+        page = ranking.top(number * PAGE_SIZE + 1)[(number - 1) * PAGE_SIZE:]
+
+    # One extra row tells whether there is a next page
+    next_cursor = None
+    if len(page) > PAGE_SIZE:
+        page = page[:PAGE_SIZE]
+        next_cursor = encode_cursor(page[-1][1], page[-1][0])
+
+    page_ids = [user_id for user_id, _ in page]
+    usernames = dict(CustomUser.objects.filter(id__in=page_ids).values_list('id', 'username'))
+    if similarity == 'count':
+        # Blended scores are not counts; friends of friends bring their own
+        common_counts = {**dict(page), **friends_of_friends.common_counts}
+    else:
+        common_counts = Counter(
+            UserHobby.objects.filter(customuser_id__in=page_ids, hobby_id__in=hobby_ids)
+            .values_list('customuser_id', flat=True)
+        )
+    rows = [
+        {
+            'id': user_id,
+            'username': usernames[user_id],
+            'common_hobby_count': common_counts[user_id],
+            'mutual_friends': friends_of_friends.mutual.get(user_id, 0),
+            'score': score,
+        }
+        for user_id, score in page
+        # In-memory backends may still hold users deleted by another worker
+        if user_id in usernames
+    ]
+    return rows, num_pages, next_cursor
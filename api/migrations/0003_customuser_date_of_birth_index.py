@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_thread'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='date_of_birth',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='thread',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='threads', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_similarity(apps, schema_editor):
+    UserSimilarity = apps.get_model('api', 'UserSimilarity')
+    CustomUser = apps.get_model('api', 'CustomUser')
+    quote = schema_editor.connection.ops.quote_name
+    schema_editor.execute(
+        f"""
+        INSERT INTO {quote(UserSimilarity._meta.db_table)} (user_a_id, user_b_id, common_hobby_count)
+        SELECT a.customuser_id, b.customuser_id, COUNT(*)
+        FROM {quote(CustomUser.hobbies.through._meta.db_table)} a
+        JOIN {quote(CustomUser.hobbies.through._meta.db_table)} b
+            ON a.hobby_id = b.hobby_id AND a.customuser_id <> b.customuser_id
+        GROUP BY a.customuser_id, b.customuser_id
+        """
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_customuser_date_of_birth_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('common_hobby_count', models.PositiveIntegerField(default=0)),
+                ('user_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to=settings.AUTH_USER_MODEL)),
+                ('user_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_a', '-common_hobby_count', 'user_b'], name='similarity_rank_idx')],
+                'unique_together': {('user_a', 'user_b')},
+            },
+        ),
+        migrations.RunPython(backfill_similarity, migrations.RunPython.noop),
+    ]
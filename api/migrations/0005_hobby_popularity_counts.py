@@ -0,0 +1,39 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:15
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counts(apps, schema_editor):
+    Hobby = apps.get_model('api', 'Hobby')
+    CustomUser = apps.get_model('api', 'CustomUser')
+    UserHobby = CustomUser.hobbies.through
+
+    def counted(field):
+        rows = UserHobby.objects.filter(**{field: OuterRef('pk')}).values(field).annotate(n=Count('id')).values('n')
+        return Coalesce(Subquery(rows), 0)
+
+    Hobby.objects.update(user_count=counted('hobby_id'))
+    CustomUser.objects.update(hobby_count=counted('customuser_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_usersimilarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='hobby_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hobby',
+            name='user_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hobby',
+            name='unused_since',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
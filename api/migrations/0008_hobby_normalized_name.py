@@ -0,0 +1,108 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+CHUNK_SIZE = 500
+
+# Same as api.similarity.REBUILD_SQL, limited to the rows of some users
+RECOUNT_SQL = """
+    INSERT INTO {similarity} (user_a_id, user_b_id, common_hobby_count)
+    SELECT a.customuser_id, b.customuser_id, COUNT(*)
+    FROM {user_hobby} a
+    JOIN {user_hobby} b ON a.hobby_id = b.hobby_id AND a.customuser_id <> b.customuser_id
+    WHERE {side}.customuser_id IN ({users})
+    GROUP BY a.customuser_id, b.customuser_id
+"""
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Fill normalized_name and merge hobbies whose names only differ in case or
+    whitespace into the oldest of them, moving their users over.
+    """
+    Hobby = apps.get_model('api', 'Hobby')
+    CustomUser = apps.get_model('api', 'CustomUser')
+    Recommendation = apps.get_model('api', 'Recommendation')
+    UserSimilarity = apps.get_model('api', 'UserSimilarity')
+    UserHobby = CustomUser.hobbies.through
+
+    canonical, merged, kept = {}, {}, []
+    for hobby in Hobby.objects.order_by('id').only('id', 'name'):
+        name = ' '.join(hobby.name.split())
+        normalized = name.casefold()
+        if normalized in canonical:
+            merged[hobby.id] = canonical[normalized]
+        else:
+            canonical[normalized] = hobby.id
+            hobby.name, hobby.normalized_name = name, normalized
+            kept.append(hobby)
+    Hobby.objects.bulk_update(kept, ['name', 'normalized_name'], batch_size=CHUNK_SIZE)
+    if not merged:
+        return
+
+    duplicate_ids = list(merged)
+    moved_user_ids = set()
+    for start in range(0, len(duplicate_ids), CHUNK_SIZE):
+        chunk = duplicate_ids[start:start + CHUNK_SIZE]
+        rows = list(UserHobby.objects.filter(hobby_id__in=chunk).values_list('customuser_id', 'hobby_id'))
+        moved_user_ids.update(user_id for user_id, _ in rows)
+        # Users who already have the surviving hobby keep a single row
+        UserHobby.objects.bulk_create(
+            [UserHobby(customuser_id=user_id, hobby_id=merged[hobby_id]) for user_id, hobby_id in rows],
+            ignore_conflicts=True,
+        )
+        Hobby.objects.filter(id__in=chunk).delete()
+
+    # Users who had two spellings now have one hobby less, so the counters
+    # are recomputed
+    def counted(field):
+        rows = UserHobby.objects.filter(**{field: OuterRef('pk')}).values(field).annotate(n=Count('id')).values('n')
+        return Coalesce(Subquery(rows), 0)
+
+    Hobby.objects.update(user_count=counted('hobby_id'))
+    CustomUser.objects.update(hobby_count=counted('customuser_id'))
+    # Stored recommendations counted both spellings; the next
+    # precompute_recommendations pass fills them again
+    Recommendation.objects.all().delete()
+    recount_similarity(schema_editor, UserSimilarity, UserHobby, sorted(moved_user_ids))
+
+
+def recount_similarity(schema_editor, UserSimilarity, UserHobby, user_ids):
+    """
+    Recount the UserSimilarity rows of ``user_ids``, the users whose hobbies
+    were merged; nobody else's common hobbies changed. Each chunk's rows are
+    recounted once as ``user_a`` and once as ``user_b``, which covers the
+    pairs of users in different chunks too.
+    """
+    quote = schema_editor.connection.ops.quote_name
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        chunk = user_ids[start:start + CHUNK_SIZE]
+        for field, side in (('user_a_id', 'a'), ('user_b_id', 'b')):
+            UserSimilarity.objects.filter(**{f'{field}__in': chunk}).delete()
+            schema_editor.execute(
+                RECOUNT_SQL.format(
+                    similarity=quote(UserSimilarity._meta.db_table),
+                    user_hobby=quote(UserHobby._meta.db_table),
+                    side=side,
+                    users=', '.join(['%s'] * len(chunk)),
+                ),
+                chunk,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_hobby_unused_since'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hobby',
+            name='normalized_name',
+            field=models.CharField(editable=False, max_length=100, null=True),
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
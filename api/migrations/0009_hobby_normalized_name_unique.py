@@ -0,0 +1,20 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separate from 0008: PostgreSQL cannot alter a table that still has
+    # pending trigger events from rows the same transaction just changed.
+
+    dependencies = [
+        ('api', '0008_hobby_normalized_name'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='hobby',
+            name='normalized_name',
+            field=models.CharField(editable=False, max_length=100, unique=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_hobby_normalized_name_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['-created_at', '-id'], name='thread_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_timelines(apps, schema_editor):
+    CustomUser = apps.get_model('api', 'CustomUser')
+    Thread = apps.get_model('api', 'Thread')
+    TimelineEntry = apps.get_model('api', 'TimelineEntry')
+    Friendship = CustomUser.friends.through
+    hubs = (
+        CustomUser.objects.annotate(friend_count=Count('friends'))
+        .filter(friend_count__gt=settings.FEED_FANOUT_MAX_FRIENDS)
+        .values('id')
+    )
+    Thread.objects.filter(user__in=hubs).update(fanned_out=False)
+    quote = schema_editor.connection.ops.quote_name
+    schema_editor.execute(
+        f"""
+        INSERT INTO {quote(TimelineEntry._meta.db_table)} (owner_id, thread_id, created_at)
+        SELECT f.to_customuser_id, t.id, t.created_at
+        FROM {quote(Thread._meta.db_table)} t
+        JOIN {quote(Friendship._meta.db_table)} f ON f.from_customuser_id = t.user_id
+        WHERE t.fanned_out = %s
+        """,
+        [True],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_thread_recent_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='fanned_out',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['user', '-created_at', '-id'], name='thread_unfanned_idx'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='thread',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.thread'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['owner', '-created_at', '-thread'], name='timeline_recent_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together={('owner', 'thread')},
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
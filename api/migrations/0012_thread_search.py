@@ -0,0 +1,60 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:45
+
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE api_thread_fts USING fts5(
+        content, content='api_thread', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER api_thread_fts_insert AFTER INSERT ON api_thread BEGIN
+        INSERT INTO api_thread_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER api_thread_fts_delete AFTER DELETE ON api_thread BEGIN
+        INSERT INTO api_thread_fts(api_thread_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER api_thread_fts_update AFTER UPDATE OF content ON api_thread BEGIN
+        INSERT INTO api_thread_fts(api_thread_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO api_thread_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    "INSERT INTO api_thread_fts(api_thread_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS api_thread_fts_insert",
+    "DROP TRIGGER IF EXISTS api_thread_fts_delete",
+    "DROP TRIGGER IF EXISTS api_thread_fts_update",
+    "DROP TABLE IF EXISTS api_thread_fts",
+]
+
+POSTGRES_FORWARD = [
+    """ALTER TABLE api_thread ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', content)) STORED""",
+    "CREATE INDEX thread_search_idx ON api_thread USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS thread_search_idx",
+    "ALTER TABLE api_thread DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run(statements):
+    # Only SQLite and PostgreSQL get a search index, see api/fulltext.py
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_friends_feed'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
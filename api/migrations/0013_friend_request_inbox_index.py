@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_thread_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['to_user', 'status', '-created_at', '-id'], name='friend_request_inbox_idx'),
+        ),
+    ]
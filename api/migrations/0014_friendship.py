@@ -0,0 +1,71 @@
+# Generated by Django 5.1.1 on 2026-10-18 20:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def copy_friendships(apps, schema_editor):
+    # Django cannot add a through model to an existing M2M field, so the
+    # rows move from the old auto-created table to the new one. The UNION
+    # also fills in any missing mirror row.
+    OldFriendship = apps.get_model('api', 'CustomUser').friends.through
+    Friendship = apps.get_model('api', 'Friendship')
+    quote = schema_editor.connection.ops.quote_name
+    schema_editor.execute(
+        f"""
+        INSERT INTO {quote(Friendship._meta.db_table)} (user_id, friend_id, created_at)
+        SELECT a, b, %s FROM (
+            SELECT from_customuser_id AS a, to_customuser_id AS b FROM {quote(OldFriendship._meta.db_table)}
+            UNION
+            SELECT to_customuser_id, from_customuser_id FROM {quote(OldFriendship._meta.db_table)}
+        ) pairs
+        """,
+        [timezone.now()],
+    )
+
+
+def copy_friendships_back(apps, schema_editor):
+    OldFriendship = apps.get_model('api', 'CustomUser').friends.through
+    Friendship = apps.get_model('api', 'Friendship')
+    quote = schema_editor.connection.ops.quote_name
+    schema_editor.execute(
+        f"""
+        INSERT INTO {quote(OldFriendship._meta.db_table)} (from_customuser_id, to_customuser_id)
+        SELECT user_id, friend_id FROM {quote(Friendship._meta.db_table)}
+        """
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_friend_request_inbox_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Friendship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at', '-friend'], name='friendship_recent_idx')],
+                'unique_together': {('user', 'friend')},
+            },
+        ),
+        migrations.RunPython(copy_friendships, copy_friendships_back),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='friends',
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='friends',
+            field=models.ManyToManyField(blank=True, through='api.Friendship', through_fields=('user', 'friend'), to=settings.AUTH_USER_MODEL),
+        ),
+    ]
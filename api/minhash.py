@@ -0,0 +1,125 @@
+"""
+MinHash signatures and LSH buckets for approximate hobby matching.
+
+Every user's hobby set is summarised by ``bands * rows`` MinHash values.
+The signature is cut into ``bands`` slices and each slice is used as a bucket
+key, so users with similar hobby sets are likely to collide in at least one
+band. Only colliding users become candidates for the exact re-ranking in
+api/matching.py.
+
+Bucket entries are never removed in place: a user whose hobbies change is
+simply added under the new keys, and stale entries are harmless because the
+candidates are re-scored exactly. The per-worker index is rebuilt after
+``HOBBY_LSH_MAX_AGE`` seconds, which also drops the stale entries.
+"""
+import random
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.dispatch import receiver
+
+from .models import CustomUser
+from .signals import hobbies_changed
+
+UserHobby = CustomUser.hobbies.through
+
+# Mersenne prime used by the (a * x + b) mod p hash family
+PRIME = (1 << 61) - 1
+
+
+class MinHashIndex:
+    """LSH buckets over MinHash signatures of hobby id sets."""
+
+    def __init__(self, bands, rows, seed=1):
+        self.bands = bands
+        self.rows = rows
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, PRIME), rng.randrange(PRIME)) for _ in range(bands * rows)]
+        self.hobby_hashes = {}
+        self.buckets = [defaultdict(lambda: array('q')) for _ in range(bands)]
+        self.built_at = time.monotonic()
+
+    def hashes_of(self, hobby_id):
+        # The hobby vocabulary is small, so every hobby is hashed only once
+        hashes = self.hobby_hashes.get(hobby_id)
+        if hashes is None:
+            hashes = self.hobby_hashes[hobby_id] = tuple((a * hobby_id + b) % PRIME for a, b in self.params)
+        return hashes
+
+    def signature(self, hobby_ids):
+        hashes = [self.hashes_of(hobby_id) for hobby_id in hobby_ids]
+        return tuple(map(min, zip(*hashes))) if hashes else None
+
+    def band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def add(self, user_id, hobby_ids):
+        signature = self.signature(hobby_ids)
+        if signature is not None:
+            for band, key in self.band_keys(signature):
+                self.buckets[band][key].append(user_id)
+
+    def candidates(self, hobby_ids, limit, exclude=()):
+        """Up to ``limit`` user ids colliding with ``hobby_ids``, most collisions first."""
+        signature = self.signature(hobby_ids)
+        if signature is None:
+            return []
+        collisions = Counter()
+        for band, key in self.band_keys(signature):
+            members = self.buckets[band].get(key)
+            if members:
+                # Newest entries are at the end; bound the work per bucket
+                collisions.update(set(members[-limit:]))
+        for user_id in exclude:
+            collisions.pop(user_id, None)
+        return [user_id for user_id, _ in collisions.most_common(limit)]
+
+    def size(self):
+        return sum(len(members) for buckets in self.buckets for members in buckets.values())
+
+
+class SharedMinHashIndex:
+    """The per-worker ``MinHashIndex``, loaded lazily from the database."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+
+    def get(self):
+        with self.lock:
+            if self.index is None or time.monotonic() - self.index.built_at > settings.HOBBY_LSH_MAX_AGE:
+                self.index = self.load()
+            return self.index
+
+    def load(self):
+        index = MinHashIndex(settings.HOBBY_LSH_BANDS, settings.HOBBY_LSH_ROWS)
+        rows = UserHobby.objects.order_by('customuser_id').values_list('customuser_id', 'hobby_id')
+        for user_id, memberships in groupby(rows.iterator(chunk_size=10000), key=itemgetter(0)):
+            index.add(user_id, [hobby_id for _, hobby_id in memberships])
+        return index
+
+    def update(self, user_id):
+        with self.lock:
+            if self.index is None:
+                return
+            hobby_ids = UserHobby.objects.filter(customuser_id=user_id).values_list('hobby_id', flat=True)
+            self.index.add(user_id, list(hobby_ids))
+
+    def reset(self):
+        """Forget the loaded index, e.g. after the database was replaced."""
+        with self.lock:
+            self.index = None
+
+
+lsh_index = SharedMinHashIndex()
+
+
+@receiver(hobbies_changed)
+def update_lsh_buckets(sender, user, added, removed, **kwargs):
+    lsh_index.update(user.id)
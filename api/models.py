@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.db.models.signals import m2m_changed
 
 # Create your models here.
 
@@ -11,22 +12,79 @@ class PageView(models.Model):
     def __str__(self):
         return f"Page view count: {self.count}"
 
+def clean_hobby_name(name):
+    """Collapse runs of whitespace, so "  Board   games " is stored as "Board games"."""
+    return " ".join(name.split())
+
+
+def normalize_hobby_name(name):
+    """Key under which hobby names are unique: "Guitar" and "guitar " are the same hobby."""
+    return clean_hobby_name(name).casefold()
+
+
 class Hobby(models.Model):
     name = models.CharField(max_length=100)
+    normalized_name = models.CharField(max_length=100, unique=True, editable=False)  # Set from name on save()
     id = models.AutoField(primary_key=True)
+    user_count = models.PositiveIntegerField(default=0)  # Number of users with this hobby, kept by api/weights.py
+    unused_since = models.DateTimeField(null=True, blank=True, db_index=True)  # Set by the collect_hobbies command
 
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        # bulk_create skips this, so callers set normalized_name themselves
+        self.name = clean_hobby_name(self.name)
+        self.normalized_name = normalize_hobby_name(self.name)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "name" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "normalized_name"}
+        super().save(*args, **kwargs)
     
 class CustomUser(AbstractUser):
-    friends = models.ManyToManyField('self', blank=True, symmetrical=True)
+    friends = models.ManyToManyField('self', blank=True, symmetrical=True, through='Friendship', through_fields=('user', 'friend'))
     # Inherited fields: username, email, password, first_name, last_name, etc.
     email = models.EmailField(unique=True)  # Enforce unique email addresses
-    date_of_birth = models.DateField(null=True, blank=True)  # Optional field
+    date_of_birth = models.DateField(null=True, blank=True, db_index=True)  # Optional field, indexed for the age filter in top_users
     hobbies = models.ManyToManyField('Hobby', blank=True, related_name='users')  # Many-to-many with Hobby
+    hobby_count = models.PositiveIntegerField(default=0)  # Number of hobbies, kept by api/weights.py
 
     def __str__(self):
         return self.username
+class FriendshipManager(models.Manager):
+    def befriend(self, user, friend):
+        """Make two users friends with a single insert of both directions."""
+        self.bulk_create(
+            [Friendship(user_id=user.id, friend_id=friend.id), Friendship(user_id=friend.id, friend_id=user.id)],
+            ignore_conflicts=True,
+        )
+        # What user.friends.add(friend) sends, so its receivers keep working
+        m2m_changed.send(
+            sender=Friendship, instance=user, action='post_add', reverse=False,
+            model=CustomUser, pk_set={friend.id}, using=self.db,
+        )
+
+
+class Friendship(models.Model):
+    # One direction of a friendship; CustomUser.friends is symmetrical, so
+    # every friendship is stored as two rows.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='friendships', on_delete=models.CASCADE)
+    friend = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = FriendshipManager()
+
+    class Meta:
+        unique_together = ('user', 'friend')
+        indexes = [
+            # A user's friends, most recent first, for keyset pages
+            models.Index(fields=['user', '-created_at', '-friend'], name='friendship_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} & {self.friend}"
+
+
 class FriendRequest(models.Model):
     # Define status choices
     STATUS_CHOICES = [
@@ -48,6 +106,10 @@ class FriendRequest(models.Model):
     class Meta:
         # Prevent duplicate requests between the same users
         unique_together = ('from_user', 'to_user')  
+        indexes = [
+            # A user's pending requests, newest first, for the keyset pages of get_friend_requests
+            models.Index(fields=['to_user', 'status', '-created_at', '-id'], name='friend_request_inbox_idx'),
+        ]
 
     def __str__(self):
         return f"{self.from_user} -> {self.to_user} ({self.status})"
@@ -57,6 +119,62 @@ class Thread (models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='threads')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    fanned_out = models.BooleanField(default=True)  # False when friends' feeds read it at request time, see api/feed.py
+
+    class Meta:
+        indexes = [
+            # Newest first, with id breaking ties, for the keyset pages of thread_list
+            models.Index(fields=['-created_at', '-id'], name='thread_recent_idx'),
+            # Only the few threads of authors with too many friends to fan out
+            models.Index(
+                fields=['user', '-created_at', '-id'], condition=models.Q(fanned_out=False), name='thread_unfanned_idx',
+            ),
+        ]
     
     def __str__(self):
-        return f"{self.user}: {self.content[:30]}"
\ No newline at end of file
+        return f"{self.user}: {self.content[:30]}"
+
+class TimelineEntry(models.Model):
+    # A friend's thread in someone's friends feed, written when the thread is
+    # posted so a feed page is a single index range scan.
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE)
+    thread = models.ForeignKey(Thread, related_name='+', on_delete=models.CASCADE)
+    created_at = models.DateTimeField()  # Copy of thread.created_at, for the index
+
+    class Meta:
+        unique_together = ('owner', 'thread')
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-thread'], name='timeline_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.thread} in the feed of {self.owner}"
+
+
+class UserSimilarity(models.Model):
+    # Materialized number of hobbies two users share. Every pair is stored in
+    # both directions so a user's best matches are a single index range scan.
+    user_a = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='similarities', on_delete=models.CASCADE)
+    user_b = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE)
+    common_hobby_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user_a', 'user_b')
+        indexes = [
+            models.Index(fields=['user_a', '-common_hobby_count', 'user_b'], name='similarity_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_a} ~ {self.user_b} ({self.common_hobby_count})"
+
+
+class Recommendation(models.Model):
+    # Best matches of a user, precomputed off the request path by the
+    # precompute_recommendations command and read by top_users.
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True, related_name='recommendation', on_delete=models.CASCADE)
+    similarity = models.CharField(max_length=10)
+    candidates = models.JSONField(default=list)  # [[user id, score], ...], best first
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Recommendations for {self.user} ({len(self.candidates)})"
@@ -0,0 +1,26 @@
+"""
+Opaque cursor tokens for keyset pagination.
+
+A cursor is the sort key of the last row on a page, JSON encoded and
+wrapped in URL safe base64 so clients can pass it back untouched.
+"""
+import base64
+import binascii
+import json
+
+
+def encode_cursor(*values):
+    payload = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Return the ``size`` values stored in ``token``; raises ValueError if it is malformed."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (AttributeError, TypeError, binascii.Error, UnicodeError, json.JSONDecodeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor.")
+    return values
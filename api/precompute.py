@@ -0,0 +1,74 @@
+"""
+Precomputed recommendations, see the precompute_recommendations command.
+
+The worker processes score users against an index of every hobby's
+members loaded once per process; the results are written to the
+``Recommendation`` table that the ``precomputed`` backend reads.
+"""
+import heapq
+from datetime import date
+
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .matching import HobbyIndex, rank_key
+from .models import CustomUser, Recommendation
+from .signals import hobbies_changed
+
+UserHobby = CustomUser.hobbies.through
+
+# Every user with a date of birth
+ANY_BIRTH_DATE = (date.min, date.max)
+
+_index = None
+
+
+def worker_index():
+    global _index
+    if _index is None:
+        hobby_ids = UserHobby.objects.values_list('hobby_id', flat=True).distinct()
+        _index = HobbyIndex.for_hobbies(list(hobby_ids), ANY_BIRTH_DATE)
+    return _index
+
+
+def compute(user_ids, similarity, limit):
+    """Return ``[(user_id, candidates), ...]`` with the ``limit`` best matches of each user."""
+    index = worker_index()
+    hobbies = {user_id: [] for user_id in user_ids}
+    for user_id, hobby_id in UserHobby.objects.filter(customuser_id__in=user_ids).values_list('customuser_id', 'hobby_id'):
+        hobbies[user_id].append(hobby_id)
+
+    results = []
+    for user_id, hobby_ids in hobbies.items():
+        subset = HobbyIndex({hobby_id: index.postings.get(hobby_id, ()) for hobby_id in hobby_ids}, index.sizes)
+        scores = subset.scores(similarity, hobby_ids, exclude={user_id})
+        best = heapq.nsmallest(limit, scores.items(), key=rank_key)
+        results.append((user_id, [[candidate_id, score] for candidate_id, score in best]))
+    return results
+
+
+def store(results, similarity):
+    now = timezone.now()
+    Recommendation.objects.bulk_create(
+        [
+            Recommendation(user_id=user_id, similarity=similarity, candidates=candidates, computed_at=now)
+            for user_id, candidates in results
+        ],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['similarity', 'candidates', 'computed_at'],
+    )
+
+
+def active_users(since=None):
+    users = CustomUser.objects.filter(is_active=True)
+    if since is not None:
+        users = users.filter(Q(last_login__gte=since) | Q(date_joined__gte=since))
+    return users
+
+
+@receiver(hobbies_changed)
+def drop_stale_recommendations(sender, user, added, removed, **kwargs):
+    # The user's own list is served live until the next precompute pass
+    Recommendation.objects.filter(user_id=user.id).delete()
@@ -0,0 +1,13 @@
+from django.dispatch import Signal
+
+# Sent by the views after a user's hobbies change, with the keyword arguments
+# ``user``, ``added`` and ``removed`` (sets of hobby ids). Receivers keep the
+# derived matching data (api/similarity.py, api/weights.py, ...) up to date.
+hobbies_changed = Signal()
+
+# Sent after hobbies are created with bulk_create, which sends no post_save,
+# with ``hobby_ids``.
+hobbies_created = Signal()
+
+# Sent by update_profile when a user's date_of_birth changes, with ``user``.
+date_of_birth_changed = Signal()
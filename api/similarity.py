@@ -0,0 +1,101 @@
+"""
+Incremental maintenance of the ``UserSimilarity`` table.
+
+When a user gains or loses hobbies only the pairs formed with the other
+members of those hobbies are touched; nobody else is rescored.
+"""
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.dispatch import receiver
+
+from .models import CustomUser, UserSimilarity
+from .signals import hobbies_changed
+
+UserHobby = CustomUser.hobbies.through
+
+# Keeps IN (...) lists below SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+
+def chunked(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def common_hobby_deltas(user_id, added, removed):
+    """Change in common hobby count between ``user_id`` and every affected user."""
+    deltas = Counter()
+    for hobby_ids, step in ((added, 1), (removed, -1)):
+        if not hobby_ids:
+            continue
+        members = (
+            UserHobby.objects
+            .filter(hobby_id__in=hobby_ids)
+            .exclude(customuser_id=user_id)
+            .values_list('customuser_id', flat=True)
+        )
+        for other_id in members.iterator():
+            deltas[other_id] += step
+    return deltas
+
+
+def apply_hobby_change(user_id, added=(), removed=()):
+    """
+    Add ``step`` to the pairs ``user_id`` forms with every affected user.
+
+    Safe against concurrent changes: missing pairs are inserted at zero with
+    conflicts ignored, so two workers creating the same pair cannot fail, and
+    the counts then move with single UPDATE statements, which lock each row
+    and never overwrite another transaction's increment. ``update_conflicts``
+    cannot replace the UPDATE, since it can only set the inserted value.
+    """
+    by_step = defaultdict(list)
+    for other_id, step in common_hobby_deltas(user_id, added, removed).items():
+        if step:
+            by_step[step].append(other_id)
+
+    with transaction.atomic():
+        for step, other_ids in by_step.items():
+            # Sorted, so concurrent changes lock the rows in the same order
+            for chunk in chunked(sorted(other_ids)):
+                if step > 0:
+                    new_pairs = []
+                    for other_id in chunk:
+                        new_pairs.append(UserSimilarity(user_a_id=user_id, user_b_id=other_id, common_hobby_count=0))
+                        new_pairs.append(UserSimilarity(user_a_id=other_id, user_b_id=user_id, common_hobby_count=0))
+                    UserSimilarity.objects.bulk_create(new_pairs, ignore_conflicts=True)
+                bump = F('common_hobby_count') + step
+                UserSimilarity.objects.filter(user_a_id=user_id, user_b_id__in=chunk).update(common_hobby_count=bump)
+                UserSimilarity.objects.filter(user_a_id__in=chunk, user_b_id=user_id).update(common_hobby_count=bump)
+
+        if removed:
+            UserSimilarity.objects.filter(user_a_id=user_id, common_hobby_count=0).delete()
+            UserSimilarity.objects.filter(user_b_id=user_id, common_hobby_count=0).delete()
+
+
+def rebuild():
+    """Recompute the whole table from the hobby/user through table."""
+    with transaction.atomic():
+        UserSimilarity.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(REBUILD_SQL.format(
+                similarity=connection.ops.quote_name(UserSimilarity._meta.db_table),
+                user_hobby=connection.ops.quote_name(UserHobby._meta.db_table),
+            ))
+
+
+REBUILD_SQL = """
+    INSERT INTO {similarity} (user_a_id, user_b_id, common_hobby_count)
+    SELECT a.customuser_id, b.customuser_id, COUNT(*)
+    FROM {user_hobby} a
+    JOIN {user_hobby} b ON a.hobby_id = b.hobby_id AND a.customuser_id <> b.customuser_id
+    GROUP BY a.customuser_id, b.customuser_id
+"""
+
+
+@receiver(hobbies_changed)
+def update_similarity(sender, user, added, removed, **kwargs):
+    apply_hobby_change(user.id, added, removed)
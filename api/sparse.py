@@ -0,0 +1,273 @@
+"""
+Optional ``sparse`` backend for ``top_users``.
+
+Every worker keeps the hobby memberships as a CSR matrix (users x hobbies)
+next to an array of ``date_of_birth`` ordinals. A requester's common hobby
+counts are then one sparse matrix-vector product, and the age window is a
+vectorized mask over the ordinal array.
+
+Changes made in this worker are recorded in small overlays and folded into
+the matrix in memory once enough of them pile up. Other workers' changes are
+picked up when the matrix is reloaded after ``HOBBY_MATRIX_MAX_AGE`` seconds.
+
+Needs numpy and scipy, which are not installed by default.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CustomUser
+from .signals import hobbies_changed
+from .weights import SCORE_DIGITS, SIMILARITIES, hobby_weights, jaccard
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+UserHobby = CustomUser.hobbies.through
+
+# Overlay entries allowed before they are folded into the matrix
+COMPACT_AFTER = 10000
+
+# Ordinal stored for users without a date of birth; never inside a range
+NO_BIRTH_DATE = 0
+
+
+def birth_ordinal(date_of_birth):
+    # Instances saved with a raw ISO string still hold the string
+    date_of_birth = CustomUser._meta.get_field('date_of_birth').to_python(date_of_birth)
+    return date_of_birth.toordinal() if date_of_birth else NO_BIRTH_DATE
+
+
+class MatrixState:
+    """An immutable snapshot: sorted user ids, their birth ordinals and hobby rows."""
+
+    def __init__(self, user_ids, births, matrix):
+        self.user_ids = user_ids
+        self.births = births
+        self.matrix = matrix
+        self.built_at = time.monotonic()
+
+    def row(self, user_id):
+        row = int(np.searchsorted(self.user_ids, user_id))
+        if row < len(self.user_ids) and self.user_ids[row] == user_id:
+            return row
+        return None
+
+    def hobbies_of(self, user_id):
+        row = self.row(user_id)
+        if row is None:
+            return set()
+        start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        return set(self.matrix.indices[start:end].tolist())
+
+    def birth_of(self, user_id):
+        row = self.row(user_id)
+        return NO_BIRTH_DATE if row is None else int(self.births[row])
+
+
+class HobbyMatrix:
+    """The per-worker matrix plus the overlays of changes made since it was built."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+        self.hobbies = {}  # user id -> hobby ids, for users changed since the build
+        self.births = {}  # user id -> birth ordinal, for users changed since the build
+
+    def snapshot(self):
+        with self.lock:
+            if self.state is None or time.monotonic() - self.state.built_at > settings.HOBBY_MATRIX_MAX_AGE:
+                self.load()
+            elif len(self.hobbies) + len(self.births) > COMPACT_AFTER:
+                self.compact()
+            return self.state, dict(self.hobbies), dict(self.births)
+
+    def load(self):
+        self.hobbies.clear()
+        self.births.clear()
+        users = CustomUser.objects.order_by('id').values_list('id', 'date_of_birth')
+        user_ids, births = [], []
+        for user_id, date_of_birth in users.iterator(chunk_size=10000):
+            user_ids.append(user_id)
+            births.append(birth_ordinal(date_of_birth))
+        user_ids = np.array(user_ids, dtype=np.int64)
+
+        pairs = UserHobby.objects.values_list('customuser_id', 'hobby_id')
+        pairs = np.array(list(pairs.iterator(chunk_size=10000)), dtype=np.int64).reshape(-1, 2)
+        rows = np.searchsorted(user_ids, pairs[:, 0])
+        # Drop memberships of users created after the user query ran
+        known = rows < len(user_ids)
+        known[known] = user_ids[rows[known]] == pairs[known, 0]
+        self.state = MatrixState(
+            user_ids,
+            np.array(births, dtype=np.int32),
+            self.csr(rows[known], pairs[known, 1], len(user_ids)),
+        )
+
+    def compact(self):
+        """Fold the overlays into a new matrix without going back to the database."""
+        state = self.state
+        changed = np.array(sorted(set(self.hobbies) | set(self.births)), dtype=np.int64)
+        user_ids = np.union1d(state.user_ids, changed)
+        moved = np.searchsorted(user_ids, state.user_ids)
+
+        births = np.full(len(user_ids), NO_BIRTH_DATE, dtype=np.int32)
+        births[moved] = state.births
+        for user_id, birth in self.births.items():
+            births[np.searchsorted(user_ids, user_id)] = birth
+
+        coo = state.matrix.tocoo()
+        keep = ~np.isin(state.user_ids[coo.row], np.fromiter(self.hobbies, dtype=np.int64))
+        rows = [moved[coo.row[keep]]]
+        cols = [coo.col[keep].astype(np.int64)]
+        for user_id, hobby_ids in self.hobbies.items():
+            rows.append(np.full(len(hobby_ids), np.searchsorted(user_ids, user_id), dtype=np.int64))
+            cols.append(np.fromiter(hobby_ids, dtype=np.int64, count=len(hobby_ids)))
+
+        self.state = MatrixState(user_ids, births, self.csr(np.concatenate(rows), np.concatenate(cols), len(user_ids)))
+        # A compaction is not a reload; keep the original age for the refresh timer
+        self.state.built_at = state.built_at
+        self.hobbies.clear()
+        self.births.clear()
+
+    @staticmethod
+    def csr(rows, cols, user_count):
+        # Hobby ids are used directly as column numbers
+        width = int(cols.max()) + 1 if len(cols) else 1
+        data = np.ones(len(rows), dtype=np.int32)
+        return sparse.csr_matrix((data, (rows, cols)), shape=(user_count, width))
+
+    def set_hobbies(self, user_id, added, removed):
+        with self.lock:
+            if self.state is None:
+                return
+            current = self.hobbies.get(user_id)
+            if current is None:
+                current = self.state.hobbies_of(user_id)
+            self.hobbies[user_id] = (current | set(added)) - set(removed)
+
+    def set_birth(self, user_id, birth):
+        with self.lock:
+            if self.state is None:
+                return
+            current = self.births.get(user_id)
+            if current is None and self.state.row(user_id) is not None:
+                current = self.state.birth_of(user_id)
+            if current != birth:
+                self.births[user_id] = birth
+
+    def forget(self, user_id):
+        with self.lock:
+            if self.state is None:
+                return
+            self.hobbies[user_id] = set()
+            self.births[user_id] = NO_BIRTH_DATE
+
+    def reset(self):
+        """Forget the loaded matrix, e.g. after the database was replaced."""
+        with self.lock:
+            self.state = None
+            self.hobbies.clear()
+            self.births.clear()
+
+
+hobby_matrix = HobbyMatrix()
+
+
+class SparseRanking:
+    """Ranks the requester's matches with one mat-vec product over ``hobby_matrix``."""
+
+    similarities = SIMILARITIES
+
+    def __init__(self, user, hobby_ids, birth_dates, similarity):
+        if np is None:
+            raise ImproperlyConfigured("The 'sparse' hobby match backend requires numpy and scipy.")
+        state, hobbies, births = hobby_matrix.snapshot()
+        mine = set(hobby_ids)
+        weights = hobby_weights.idf(mine) if similarity == 'idf' else None
+        low, high = (day.toordinal() for day in birth_dates)
+
+        width = state.matrix.shape[1]
+        columns = [hobby_id for hobby_id in mine if hobby_id < width]
+        indicator = np.zeros(width, dtype=np.int32)
+        indicator[columns] = 1
+        counts = state.matrix @ indicator
+        if similarity == 'idf':
+            weight_vector = np.zeros(width)
+            weight_vector[columns] = [weights[hobby_id] for hobby_id in columns]
+            scores = np.round(state.matrix @ weight_vector, SCORE_DIGITS)
+        elif similarity == 'jaccard':
+            sizes = np.diff(state.matrix.indptr)
+            scores = np.round(counts / np.maximum(len(mine) + sizes - counts, np.maximum(counts, 1)), SCORE_DIGITS)
+        else:
+            scores = counts
+        mask = (counts > 0) & (state.births >= low) & (state.births <= high)
+
+        # Users changed since the build (and the requester) are scored from the overlays
+        changed = set(hobbies) | set(births)
+        for user_id in changed | {user.id}:
+            row = state.row(user_id)
+            if row is not None:
+                mask[row] = False
+        extra = []
+        for user_id in changed - {user.id}:
+            theirs = hobbies.get(user_id, state.hobbies_of(user_id))
+            shared = mine & theirs
+            if shared and low <= births.get(user_id, state.birth_of(user_id)) <= high:
+                if similarity == 'idf':
+                    score = round(sum(weights[hobby_id] for hobby_id in shared), SCORE_DIGITS)
+                elif similarity == 'jaccard':
+                    score = jaccard(len(shared), len(mine), len(theirs))
+                else:
+                    score = len(shared)
+                extra.append((user_id, score))
+
+        self.ids = np.concatenate([state.user_ids[mask], np.array([i for i, _ in extra], dtype=np.int64)])
+        self.scores = np.concatenate([scores[mask], np.array([s for _, s in extra], dtype=scores.dtype)])
+
+    def exclude(self, connected, candidates):
+        user_ids = set(connected) | set(candidates)
+        keep = ~np.isin(self.ids, np.fromiter(user_ids, dtype=np.int64, count=len(user_ids)))
+        self.ids, self.scores = self.ids[keep], self.scores[keep]
+
+    def count(self):
+        return len(self.ids)
+
+    def top(self, limit, after=None):
+        ids, scores = self.ids, self.scores
+        if after is not None:
+            user_id, score = after
+            keep = (scores < score) | ((scores == score) & (ids > user_id))
+            ids, scores = ids[keep], scores[keep]
+        if len(scores) > limit:
+            # Only candidates scoring at least the limit-th best score can make the page
+            threshold = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            keep = scores >= threshold
+            ids, scores = ids[keep], scores[keep]
+        order = np.lexsort((ids, -scores))[:limit]
+        return list(zip(ids[order].tolist(), scores[order].tolist()))
+
+
+@receiver(hobbies_changed)
+def update_hobby_matrix(sender, user, added, removed, **kwargs):
+    hobby_matrix.set_hobbies(user.id, added, removed)
+
+
+@receiver(post_save, sender=CustomUser)
+def update_birth_ordinal(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'date_of_birth' not in update_fields:
+        # e.g. a login's last_login save; the instance's date of birth may be stale
+        return
+    hobby_matrix.set_birth(instance.id, birth_ordinal(instance.date_of_birth))
+
+
+@receiver(post_delete, sender=CustomUser)
+def drop_user_row(sender, instance, **kwargs):
+    hobby_matrix.forget(instance.id)
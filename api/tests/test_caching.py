@@ -0,0 +1,84 @@
+import json
+from datetime import date, timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from api import caching
+from api.graph import friend_graph
+from api.models import CustomUser, FriendRequest, Hobby
+
+
+class TopUsersCacheKeyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        friend_graph.reset()
+        born = date.today() - timedelta(days=30 * 365)
+        self.chess = Hobby.objects.create(name="Chess")
+        self.hiking = Hobby.objects.create(name="Hiking")
+        self.user, self.match, self.stranger = (
+            CustomUser.objects.create(username=name, email=f"{name}@example.com", date_of_birth=born)
+            for name in ("alice", "bob", "carol")
+        )
+        self.user.hobbies.add(self.chess)
+        self.match.hobbies.add(self.chess)
+        self.stranger.hobbies.add(self.hiking)
+
+    def tearDown(self):
+        friend_graph.reset()
+
+    def page(self):
+        """The cache key and users of the requester's first page."""
+        with mock.patch.object(caching, "single_flight", wraps=caching.single_flight) as single_flight:
+            users, _, _ = caching.top_users(self.user, 18, 80, backend="index", similarity="count")
+        return single_flight.call_args.args[0], [row["id"] for row in users]
+
+    def post(self, user, path, data):
+        self.client.force_login(user)
+        response = self.client.post(path, json.dumps(data), content_type="application/json")
+        self.assertLess(response.status_code, 300)
+
+    def test_repeat_request_reuses_the_key(self):
+        key, users = self.page()
+        self.assertEqual(users, [self.match.id])
+        self.assertEqual(self.page()[0], key)
+
+    def test_friend_request_and_accept_change_the_key(self):
+        key, _ = self.page()
+        self.post(self.user, "/send-friend-request/", {"to_user_id": self.match.id})
+        requested_key, users = self.page()
+        self.assertNotEqual(requested_key, key)
+        self.assertEqual(users, [])
+
+        friend_request = FriendRequest.objects.get(from_user=self.user, to_user=self.match)
+        self.post(self.match, "/accept-friend-request/", {"request_id": friend_request.id})
+        accepted_key, users = self.page()
+        self.assertNotIn(accepted_key, (key, requested_key))
+        self.assertEqual(users, [])
+
+    def test_match_birth_date_change_changes_the_key(self):
+        key, _ = self.page()
+        self.post(self.match, "/updateprofile/", {"date_of_birth": (date.today() - timedelta(days=90 * 365)).isoformat()})
+        new_key, users = self.page()
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(users, [])
+
+    def test_hobby_changes_change_the_key(self):
+        key, _ = self.page()
+        # A newcomer to one of the requester's hobbies
+        self.post(self.stranger, "/updatehobbies/", {"hobbies": [{"name": "Hiking"}, {"name": "Chess"}]})
+        new_key, users = self.page()
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(sorted(users), sorted([self.match.id, self.stranger.id]))
+
+        # The requester's own hobbies
+        self.post(self.user, "/updatehobbies/", {"hobbies": [{"name": "Hiking"}]})
+        own_key, users = self.page()
+        self.assertNotEqual(own_key, new_key)
+        self.assertEqual(users, [self.stranger.id])
+
+    def test_unrelated_change_keeps_the_key(self):
+        key, _ = self.page()
+        self.post(self.stranger, "/updatehobbies/", {"hobbies": [{"name": "Hiking"}, {"name": "Painting"}]})
+        self.assertEqual(self.page()[0], key)
@@ -0,0 +1,51 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import CustomUser, Hobby
+
+
+class CollectHobbiesTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username="alice", email="alice@example.com")
+        self.used = Hobby.objects.create(name="Chess")
+        self.unused = Hobby.objects.create(name="Guitar")
+        self.user.hobbies.add(self.used)
+
+    def collect(self, grace=3600):
+        # One hobby per batch, so the pass walks several id ranges
+        call_command("collect_hobbies", grace=grace, batch_size=1, stdout=StringIO())
+
+    def unused_since(self, hobby):
+        return Hobby.objects.filter(id=hobby.id).values_list("unused_since", flat=True).first()
+
+    def test_unused_hobby_is_marked_then_deleted_after_the_grace_period(self):
+        self.collect()
+        marked_at = self.unused_since(self.unused)
+        self.assertIsNotNone(marked_at)
+
+        # Still inside the grace period: kept, and its mark is not moved
+        self.collect()
+        self.assertEqual(self.unused_since(self.unused), marked_at)
+
+        Hobby.objects.filter(id=self.unused.id).update(unused_since=timezone.now() - timedelta(hours=2))
+        self.collect()
+        self.assertFalse(Hobby.objects.filter(id=self.unused.id).exists())
+
+    def test_referenced_hobby_is_never_marked_or_deleted(self):
+        self.collect(grace=0)
+        self.assertTrue(Hobby.objects.filter(id=self.used.id, unused_since__isnull=True).exists())
+        self.assertFalse(Hobby.objects.filter(id=self.unused.id).exists())
+
+    def test_hobby_picked_again_is_unmarked_and_kept(self):
+        Hobby.objects.filter(id=self.unused.id).update(unused_since=timezone.now() - timedelta(hours=2))
+        self.user.hobbies.add(self.unused)
+        self.collect()
+        self.assertIsNone(self.unused_since(self.unused))
+
+    def test_negative_grace_is_rejected(self):
+        with self.assertRaises(CommandError):
+            self.collect(grace=-1)
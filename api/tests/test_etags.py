@@ -0,0 +1,66 @@
+import json
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from api.models import CustomUser, FriendRequest
+
+
+class VersionedETagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(username="alice", email="alice@example.com")
+        self.other = CustomUser.objects.create(username="bob", email="bob@example.com")
+        self.client.force_login(self.user)
+
+    def get(self, path, etag=None):
+        return self.client.get(path, **({"HTTP_IF_NONE_MATCH": etag} if etag else {}))
+
+    def assertChanged(self, path, etag):
+        response = self.get(path, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        return response["ETag"]
+
+    def test_repeat_request_gets_304(self):
+        for path in ("/currentuser/", "/get-friends/", "/friends/"):
+            with self.subTest(path=path):
+                response = self.get(path)
+                self.assertEqual(response.status_code, 200)
+                repeat = self.get(path, response["ETag"])
+                self.assertEqual(repeat.status_code, 304)
+                self.assertEqual(repeat["ETag"], response["ETag"])
+
+    def test_hobby_change_gives_a_new_profile_etag(self):
+        etag = self.get("/currentuser/")["ETag"]
+        self.client.post("/add_single_hobby", json.dumps({"name": "Chess"}), content_type="application/json")
+        etag = self.assertChanged("/currentuser/", etag)
+        self.client.post("/updatehobbies/", json.dumps({"hobbies": []}), content_type="application/json")
+        self.assertChanged("/currentuser/", etag)
+
+    def test_profile_edit_gives_a_new_etag_but_a_login_does_not(self):
+        etag = self.get("/currentuser/")["ETag"]
+        self.user.save(update_fields=["last_login"])
+        self.assertEqual(self.get("/currentuser/", etag).status_code, 304)
+        self.client.post("/updateprofile/", json.dumps({"first_name": "Alice"}), content_type="application/json")
+        self.assertChanged("/currentuser/", etag)
+
+    def test_accepted_friend_request_gives_both_users_new_friend_etags(self):
+        etags = {path: self.get(path)["ETag"] for path in ("/get-friends/", "/friends/")}
+        self.client.force_login(self.other)
+        other_etag = self.get("/get-friends/")["ETag"]
+
+        friend_request = FriendRequest.objects.create(from_user=self.user, to_user=self.other)
+        self.client.post("/accept-friend-request/", json.dumps({"request_id": friend_request.id}), content_type="application/json")
+        self.assertChanged("/get-friends/", other_etag)
+        self.client.force_login(self.user)
+        for path, etag in etags.items():
+            with self.subTest(path=path):
+                self.assertChanged(path, etag)
+
+    def test_friend_renaming_gives_a_new_friend_list_etag(self):
+        self.user.friends.add(self.other)
+        etag = self.get("/get-friends/")["ETag"]
+        self.other.username = "robert"
+        self.other.save(update_fields=["username"])
+        self.assertChanged("/get-friends/", etag)
@@ -0,0 +1,48 @@
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import CustomUser, FriendRequest
+from api.pagination import encode_cursor
+
+
+class FriendRequestInboxTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username="alice", email="alice@example.com")
+        self.client.force_login(self.user)
+        now = timezone.now()
+        for i in range(7):
+            sender = CustomUser.objects.create(username=f"sender{i}", email=f"sender{i}@example.com")
+            FriendRequest.objects.create(from_user=sender, to_user=self.user)
+        # Answered requests and requests to someone else stay out of the inbox
+        FriendRequest.objects.create(from_user=sender, to_user=CustomUser.objects.create(username="bob", email="bob@example.com"))
+        FriendRequest.objects.filter(from_user__username="sender0").update(status="accepted")
+        # Equal created_at everywhere, so pages must break ties by id
+        FriendRequest.objects.update(created_at=now)
+        self.expected = list(
+            FriendRequest.objects.filter(to_user=self.user, status="pending").order_by("-id").values_list("id", flat=True)
+        )
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            response = self.client.get("/get-friend-requests/", params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(request["id"] for request in response.json())
+            cursor = response.get("X-Next-Cursor")
+            if not cursor:
+                break
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(seen), 6)
+
+    def test_bad_cursor_is_rejected(self):
+        for cursor in ("zz", encode_cursor("not a date", 1), encode_cursor(timezone.now().isoformat())):
+            with self.subTest(cursor=cursor):
+                response = self.client.get("/get-friend-requests/", {"cursor": cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"error": "Invalid cursor."})
+
+    def test_bad_limit_is_rejected(self):
+        response = self.client.get("/get-friend-requests/", {"limit": "x"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "limit must be a number"})
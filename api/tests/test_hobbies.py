@@ -0,0 +1,74 @@
+import json
+
+from django.test import TestCase
+
+from api.models import CustomUser, Hobby
+from api.signals import hobbies_changed
+
+UserHobby = CustomUser.hobbies.through
+
+
+class UpdateHobbiesTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username="alice", email="alice@example.com")
+        self.other = CustomUser.objects.create(username="bob", email="bob@example.com")
+        self.client.force_login(self.user)
+        self.changes = []
+        hobbies_changed.connect(self.record_change)
+
+    def tearDown(self):
+        hobbies_changed.disconnect(self.record_change)
+
+    def record_change(self, sender, user, added, removed, **kwargs):
+        self.changes.append((user.id, set(added), set(removed)))
+
+    def update(self, *names):
+        response = self.client.post(
+            "/updatehobbies/", json.dumps({"hobbies": [{"name": name} for name in names]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def hobby_ids(self, user):
+        return set(user.hobbies.values_list("id", flat=True))
+
+    def test_only_the_difference_is_written(self):
+        self.update("Chess", "Guitar")
+        chess, guitar = Hobby.objects.get(name="Chess"), Hobby.objects.get(name="Guitar")
+        kept_row = UserHobby.objects.get(customuser=self.user, hobby=chess).id
+        self.changes.clear()
+
+        self.update("chess ", "Hiking")
+        hiking = Hobby.objects.get(name="Hiking")
+        self.assertEqual(self.hobby_ids(self.user), {chess.id, hiking.id})
+        self.assertEqual(self.changes, [(self.user.id, {hiking.id}, {guitar.id})])
+        # The unchanged membership keeps its row
+        self.assertEqual(UserHobby.objects.get(customuser=self.user, hobby=chess).id, kept_row)
+
+    def test_unchanged_hobbies_report_no_change(self):
+        self.update("Chess")
+        self.changes.clear()
+        self.update("Chess")
+        self.assertEqual(self.changes, [(self.user.id, set(), set())])
+
+    def test_counters_follow_the_changes(self):
+        self.update("Chess", "Guitar")
+        self.client.force_login(self.other)
+        self.update("Chess")
+        self.client.force_login(self.user)
+        self.update("Guitar", "Hiking")
+
+        counts = dict(Hobby.objects.values_list("name", "user_count"))
+        self.assertEqual(counts, {"Chess": 1, "Guitar": 1, "Hiking": 1})
+        self.user.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.user.hobby_count, self.other.hobby_count), (2, 1))
+
+    def test_spellings_of_one_hobby_are_one_hobby(self):
+        self.update("Board games", "board  GAMES ")
+        self.assertEqual(list(Hobby.objects.values_list("name", flat=True)), ["Board games"])
+        self.assertEqual(len(self.hobby_ids(self.user)), 1)
+
+    def test_missing_hobbies_field_is_rejected(self):
+        response = self.client.post("/updatehobbies/", json.dumps({}), content_type="application/json")
+        self.assertEqual(response.status_code, 400)
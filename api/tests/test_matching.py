@@ -0,0 +1,109 @@
+import random
+from datetime import date, timedelta
+
+from django.test import TestCase
+
+from api import matching, precompute, similarity, sparse
+from api.graph import friend_graph
+from api.models import CustomUser, FriendRequest, Friendship, Hobby
+
+UserHobby = CustomUser.hobbies.through
+
+
+class PrecomputedRankingTests(TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        today = date.today()
+        hobby_ids = [Hobby.objects.create(name=f"Hobby {i}").id for i in range(5)]
+        self.users = []
+        for i in range(60):
+            age = 20 + i % 30
+            user = CustomUser.objects.create(
+                username=f"user{i}", email=f"user{i}@example.com",
+                date_of_birth=today - timedelta(days=int((age + 0.5) * 365.25)),
+            )
+            picks = rng.sample(hobby_ids, rng.randint(1, 4))
+            UserHobby.objects.bulk_create(UserHobby(customuser_id=user.id, hobby_id=hobby_id) for hobby_id in picks)
+            self.users.append(user)
+        self.requester = self.users[0]
+        friend_graph.reset()
+        precompute._index = None
+        # A short stored list, as --top leaves for users with many matches
+        precompute.store(precompute.compute([self.requester.id], 'count', 5), 'count')
+
+    def tearDown(self):
+        friend_graph.reset()
+        precompute._index = None
+
+    def pages(self, backend, min_age, max_age):
+        rows, num_pages, _ = matching.top_users(self.requester, min_age, max_age, 1, backend=backend, similarity='count')
+        pages = [rows]
+        for number in range(2, num_pages + 1):
+            rows, _, _ = matching.top_users(self.requester, min_age, max_age, number, backend=backend, similarity='count')
+            pages.append(rows)
+        return num_pages, pages
+
+    def test_narrow_band_matches_index_backend(self):
+        for min_age, max_age in ((30, 32), (20, 49), (45, 45)):
+            with self.subTest(min_age=min_age, max_age=max_age):
+                self.assertEqual(self.pages('precomputed', min_age, max_age), self.pages('index', min_age, max_age))
+
+    def test_cursor_pages_match_index_backend(self):
+        for backend in ('precomputed', 'index'):
+            rows, _, cursor = matching.top_users(self.requester, 25, 40, backend=backend, similarity='count')
+            seen = [row['id'] for row in rows]
+            while cursor:
+                rows, _, cursor = matching.top_users(self.requester, 25, 40, cursor=cursor, backend=backend, similarity='count')
+                seen.extend(row['id'] for row in rows)
+            if backend == 'precomputed':
+                precomputed = seen
+        self.assertEqual(precomputed, seen)
+        self.assertGreater(len(seen), matching.PAGE_SIZE)
+
+
+class ConnectedUsersTests(TestCase):
+    def setUp(self):
+        hobby = Hobby.objects.create(name="Chess")
+        born = date.today() - timedelta(days=30 * 365)
+        self.users = [
+            CustomUser.objects.create(username=f"user{i}", email=f"user{i}@example.com", date_of_birth=born)
+            for i in range(30)
+        ]
+        UserHobby.objects.bulk_create(UserHobby(customuser_id=user.id, hobby_id=hobby.id) for user in self.users)
+        similarity.rebuild()
+        self.requester = self.users[0]
+        for friend in self.users[1:6]:
+            Friendship.objects.befriend(self.requester, friend)
+        FriendRequest.objects.create(from_user=self.requester, to_user=self.users[6])
+        FriendRequest.objects.create(from_user=self.users[7], to_user=self.requester)
+        friend_graph.reset()
+        sparse.hobby_matrix.reset()
+
+    def tearDown(self):
+        friend_graph.reset()
+        sparse.hobby_matrix.reset()
+
+    def test_table_backend_leaves_out_connected_users_like_index(self):
+        pages = {}
+        for backend in ('table', 'index'):
+            rows, num_pages, _ = matching.top_users(self.requester, 18, 80, backend=backend, similarity='count')
+            pages[backend] = (num_pages, [(row['id'], row['score']) for row in rows])
+        self.assertEqual(pages['table'], pages['index'])
+        shown = {user_id for user_id, _ in pages['table'][1]}
+        self.assertFalse(shown & {user.id for user in self.users[:8]})
+
+    def test_friendship_made_by_another_worker_is_left_out(self):
+        friend_graph.friends(self.requester.id)  # Loads this worker's graph
+        other = self.users[10]
+        # Written by another worker: no signal reaches this worker's graph
+        Friendship.objects.bulk_create([
+            Friendship(user_id=self.requester.id, friend_id=other.id),
+            Friendship(user_id=other.id, friend_id=self.requester.id),
+        ])
+        self.assertNotIn(other.id, friend_graph.friends(self.requester.id))
+        for backend in ('index', 'sparse', 'minhash', 'precomputed', 'table'):
+            if backend == 'sparse' and sparse.np is None:
+                continue
+            with self.subTest(backend=backend):
+                rows, _, _ = matching.top_users(self.requester, 18, 80, backend=backend, similarity='count')
+                self.assertNotIn(other.id, [row['id'] for row in rows])
@@ -0,0 +1,104 @@
+from collections import Counter
+from itertools import permutations
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+def common_hobbies(UserHobby):
+    """What similarity.rebuild() would store, computed in Python."""
+    members = {}
+    for user_id, hobby_id in UserHobby.objects.values_list('customuser_id', 'hobby_id'):
+        members.setdefault(hobby_id, []).append(user_id)
+    return Counter(pair for user_ids in members.values() for pair in permutations(user_ids, 2))
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Runs data migrations from ``migrate_from`` to ``migrate_to``; the database is left fully migrated."""
+
+    migrate_from = migrate_to = None
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+
+class MergeDuplicateHobbiesTests(MigrationTestCase):
+    migrate_from = [('api', '0007_hobby_unused_since')]
+    migrate_to = [('api', '0009_hobby_normalized_name_unique')]
+
+    def test_spellings_are_merged_into_the_oldest_hobby(self):
+        apps = self.migrate(self.migrate_from)
+        Hobby = apps.get_model('api', 'Hobby')
+        CustomUser = apps.get_model('api', 'CustomUser')
+        guitar = Hobby.objects.create(name='Guitar')
+        spaced = Hobby.objects.create(name='guitar ')
+        chess = Hobby.objects.create(name='Chess')
+        both = CustomUser.objects.create(username='both', email='both@example.com')
+        spaced_only = CustomUser.objects.create(username='spaced', email='spaced@example.com')
+        guitarist = CustomUser.objects.create(username='guitarist', email='guitarist@example.com')
+        player = CustomUser.objects.create(username='player', email='player@example.com')
+        both.hobbies.add(guitar, spaced, chess)
+        spaced_only.hobbies.add(spaced)
+        guitarist.hobbies.add(guitar)
+        player.hobbies.add(chess)
+        UserSimilarity = apps.get_model('api', 'UserSimilarity')
+        UserSimilarity.objects.bulk_create(
+            UserSimilarity(user_a_id=a, user_b_id=b, common_hobby_count=count)
+            for (a, b), count in common_hobbies(CustomUser.hobbies.through).items()
+        )
+
+        apps = self.migrate(self.migrate_to)
+        Hobby = apps.get_model('api', 'Hobby')
+        CustomUser = apps.get_model('api', 'CustomUser')
+        self.assertEqual(
+            list(Hobby.objects.order_by('id').values_list('id', 'name', 'normalized_name', 'user_count')),
+            [(guitar.id, 'Guitar', 'guitar', 3), (chess.id, 'Chess', 'chess', 2)],
+        )
+        self.assertEqual(set(CustomUser.objects.get(id=both.id).hobbies.values_list('id', flat=True)), {guitar.id, chess.id})
+        self.assertEqual(list(CustomUser.objects.get(id=spaced_only.id).hobbies.values_list('id', flat=True)), [guitar.id])
+        self.assertEqual(CustomUser.objects.get(id=both.id).hobby_count, 2)
+
+        # The pairs of the users who had a merged spelling are recounted
+        UserSimilarity = apps.get_model('api', 'UserSimilarity')
+        stored = {(a, b): count for a, b, count in UserSimilarity.objects.values_list('user_a_id', 'user_b_id', 'common_hobby_count')}
+        self.assertEqual(stored, dict(common_hobbies(CustomUser.hobbies.through)))
+        self.assertEqual(stored[spaced_only.id, guitarist.id], 1)
+        self.assertEqual(stored[both.id, spaced_only.id], 1)
+
+
+class CopyFriendshipsTests(MigrationTestCase):
+    migrate_from = [('api', '0013_friend_request_inbox_index')]
+    migrate_to = [('api', '0014_friendship')]
+
+    def test_friendships_are_kept_and_made_symmetric(self):
+        apps = self.migrate(self.migrate_from)
+        CustomUser = apps.get_model('api', 'CustomUser')
+        a, b, c, d = (
+            CustomUser.objects.create(username=name, email=f'{name}@example.com').id for name in 'abcd'
+        )
+        OldFriendship = CustomUser.friends.through
+        OldFriendship.objects.bulk_create([
+            # Both directions, as friends.add() stores them
+            OldFriendship(from_customuser_id=a, to_customuser_id=b),
+            OldFriendship(from_customuser_id=b, to_customuser_id=a),
+            # A row whose mirror is missing
+            OldFriendship(from_customuser_id=c, to_customuser_id=a),
+        ])
+
+        apps = self.migrate(self.migrate_to)
+        Friendship = apps.get_model('api', 'Friendship')
+        self.assertEqual(
+            sorted(Friendship.objects.values_list('user_id', 'friend_id')),
+            sorted([(a, b), (b, a), (c, a), (a, c)]),
+        )
+        self.assertFalse(Friendship.objects.filter(created_at__isnull=True).exists())
+        CustomUser = apps.get_model('api', 'CustomUser')
+        self.assertEqual(set(CustomUser.objects.get(id=a).friends.values_list('id', flat=True)), {b, c})
+        self.assertFalse(CustomUser.objects.get(id=d).friends.exists())
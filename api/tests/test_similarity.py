@@ -0,0 +1,73 @@
+import random
+
+from django.test import TestCase
+
+from api import similarity
+from api.models import CustomUser, Hobby, UserSimilarity
+
+UserHobby = CustomUser.hobbies.through
+
+
+def similarity_rows():
+    return set(UserSimilarity.objects.values_list('user_a_id', 'user_b_id', 'common_hobby_count'))
+
+
+class ApplyHobbyChangeTests(TestCase):
+    def setUp(self):
+        self.user_ids = [
+            CustomUser.objects.create(username=f"user{i}", email=f"user{i}@example.com").id for i in range(12)
+        ]
+        self.hobby_ids = [Hobby.objects.create(name=f"Hobby {i}").id for i in range(6)]
+        self.rng = random.Random(7)
+        for user_id in self.user_ids:
+            picks = self.rng.sample(self.hobby_ids, self.rng.randint(0, 4))
+            UserHobby.objects.bulk_create(UserHobby(customuser_id=user_id, hobby_id=hobby_id) for hobby_id in picks)
+        similarity.rebuild()
+
+    def change_hobbies(self, user_id, added, removed):
+        UserHobby.objects.filter(customuser_id=user_id, hobby_id__in=removed).delete()
+        UserHobby.objects.bulk_create(UserHobby(customuser_id=user_id, hobby_id=hobby_id) for hobby_id in added)
+        similarity.apply_hobby_change(user_id, added, removed)
+
+    def test_incremental_changes_match_rebuild(self):
+        for _ in range(40):
+            user_id = self.rng.choice(self.user_ids)
+            current = set(UserHobby.objects.filter(customuser_id=user_id).values_list('hobby_id', flat=True))
+            removed = set(self.rng.sample(sorted(current), self.rng.randint(0, len(current))))
+            missing = sorted(set(self.hobby_ids) - current)
+            added = set(self.rng.sample(missing, self.rng.randint(0, len(missing))))
+            self.change_hobbies(user_id, added, removed)
+
+            incremental = similarity_rows()
+            similarity.rebuild()
+            self.assertEqual(incremental, similarity_rows())
+
+    def test_removing_last_shared_hobby_deletes_the_pair(self):
+        a, b = self.user_ids[:2]
+        UserHobby.objects.filter(customuser_id__in=[a, b]).delete()
+        similarity.rebuild()
+        self.change_hobbies(a, {self.hobby_ids[0]}, set())
+        self.change_hobbies(b, {self.hobby_ids[0]}, set())
+        self.assertIn((a, b, 1), similarity_rows())
+        self.assertIn((b, a, 1), similarity_rows())
+
+        self.change_hobbies(a, set(), {self.hobby_ids[0]})
+        self.assertFalse(UserSimilarity.objects.filter(user_a_id=a, user_b_id=b).exists())
+        self.assertFalse(UserSimilarity.objects.filter(user_a_id=b, user_b_id=a).exists())
+
+    def test_pair_created_concurrently_is_bumped_not_duplicated(self):
+        # Another worker inserted the pair after this one computed its deltas
+        a, b = self.user_ids[:2]
+        UserHobby.objects.filter(customuser_id__in=[a, b]).delete()
+        similarity.rebuild()
+        UserHobby.objects.bulk_create([
+            UserHobby(customuser_id=a, hobby_id=self.hobby_ids[0]),
+            UserHobby(customuser_id=b, hobby_id=self.hobby_ids[0]),
+        ])
+        UserSimilarity.objects.bulk_create([
+            UserSimilarity(user_a_id=a, user_b_id=b, common_hobby_count=0),
+            UserSimilarity(user_a_id=b, user_b_id=a, common_hobby_count=0),
+        ])
+        similarity.apply_hobby_change(a, {self.hobby_ids[0]}, set())
+        self.assertEqual(similarity_rows() & {(a, b, 1), (b, a, 1)}, {(a, b, 1), (b, a, 1)})
+        self.assertEqual(UserSimilarity.objects.filter(user_a_id__in=[a, b], user_b_id__in=[a, b]).count(), 2)
@@ -0,0 +1,36 @@
+import unittest
+from datetime import date
+
+from django.test import TestCase
+
+from api import sparse
+from api.models import CustomUser
+
+
+@unittest.skipIf(sparse.np is None, "needs numpy and scipy")
+class BirthOverlayTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username="alice", email="alice@example.com", date_of_birth=date(1990, 1, 1))
+        sparse.hobby_matrix.reset()
+        sparse.hobby_matrix.snapshot()
+
+    def tearDown(self):
+        sparse.hobby_matrix.reset()
+
+    def birth_in_matrix(self):
+        state, hobbies, births = sparse.hobby_matrix.snapshot()
+        return births.get(self.user.id, state.birth_of(self.user.id))
+
+    def test_date_of_birth_change_is_applied(self):
+        self.user.date_of_birth = date(2000, 6, 1)
+        self.user.save()
+        self.assertEqual(self.birth_in_matrix(), date(2000, 6, 1).toordinal())
+
+    def test_stale_instance_saving_other_fields_keeps_new_birth(self):
+        stale = CustomUser.objects.get(id=self.user.id)
+        fresh = CustomUser.objects.get(id=self.user.id)
+        fresh.date_of_birth = date(2000, 6, 1)
+        fresh.save(update_fields=['date_of_birth'])
+
+        stale.save(update_fields=['last_login'])
+        self.assertEqual(self.birth_in_matrix(), date(2000, 6, 1).toordinal())
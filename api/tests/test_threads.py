@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import CustomUser, Thread
+from api.pagination import encode_cursor
+
+
+class ThreadListCursorTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username="alice", email="alice@example.com")
+        self.client.force_login(self.user)
+        now = timezone.now()
+        threads = [Thread.objects.create(user=self.user, content=f"thread {i}") for i in range(9)]
+        # Most threads share a created_at, so pages must break ties by id
+        for i, thread in enumerate(threads):
+            created_at = now if i % 4 else now - timedelta(minutes=i)
+            Thread.objects.filter(id=thread.id).update(created_at=created_at)
+        self.expected = list(Thread.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            response = self.client.get("/threads/", params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(thread["id"] for thread in response.json())
+            cursor = response.get("X-Next-Cursor")
+            if not cursor:
+                break
+        self.assertEqual(seen, self.expected)
+
+    def test_bad_cursor_is_rejected(self):
+        for cursor in ("zz", encode_cursor("not a date", 1), encode_cursor(timezone.now().isoformat(), "1"), encode_cursor(1)):
+            with self.subTest(cursor=cursor):
+                response = self.client.get("/threads/", {"cursor": cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"error": "Invalid cursor."})
@@ -31,10 +31,19 @@ urlpatterns = [
     path('send-friend-request/', views.send_friend_request, name='send_friend_request'),
     path('accept-friend-request/', views.accept_friend_request, name='accept_friend_request'),
     path('get-friend-requests/', views.get_friend_requests, name='get_friend_requests'),
+    path('friend-requests/count/', views.count_friend_requests, name='count_friend_requests'),
     path('get-friends/', views.get_friends, name='get_friends'),
+    path('friends/', views.list_friends, name='list_friends'),
+    path('friends-of-friends/', views.friends_of_friends, name='friends_of_friends'),
+    path('users/<int:user_id>/mutual-friends/', views.mutual_friends, name='mutual_friends'),
+    path('users/<int:user_id>/degree/', views.friend_degree, name='friend_degree'),
     path('all-hobbies/', views.get_all_hobbies, name='all_hobbies'),
     path('add_single_hobby', views.add_single_hobby, name="add_single_hobby"),
+    path('hobbies/search', views.search_hobbies, name='hobby_search'),
     path('threads/', views.thread_list, name='thread_list'),
+    path('threads/search', views.search_threads, name='search_threads'),
+    path('feed/', views.friends_feed, name='friends_feed'),
+    path('events/', views.event_stream, name='event_stream'),
 
     re_path(r'^.*$', login_required(views.HobbiesSPA.as_view()), name='vue_app'),
 ]
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+Version counters kept in the cache.
+
+Anything derived from a piece of data (a cached response, an ETag) embeds
+the data's version; bumping the version makes every derived value stale at
+once without having to find and delete them.
+
+A bump only reaches the processes sharing the cache. With a shared backend
+(redis, memcached) that is every worker and management command, and the
+counters never expire. The default locmem cache belongs to one process:
+writes made by another worker, a management command or a migration never
+bump its counters. There the counters expire after
+``settings.VERSION_LOCAL_TIMEOUT`` seconds and restart from a new value,
+so such a change shows up at most that many seconds late.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def fresh_version():
+    # Time based, so a counter evicted from the cache never comes back with
+    # a value that was handed out before
+    return time.time_ns()
+
+
+def shared_cache():
+    """Whether the cache is seen by every process, so that a bump reaches all of them."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def version_timeout():
+    return None if shared_cache() else settings.VERSION_LOCAL_TIMEOUT
+
+
+def get_versions(names):
+    """Current version of each name, starting a counter for names without one."""
+    versions = cache.get_many(names)
+    for name in names:
+        if name not in versions:
+            cache.add(name, fresh_version(), timeout=version_timeout())
+            versions[name] = cache.get(name)
+    return versions
+
+
+def bump(*names):
+    for name in names:
+        try:
+            cache.incr(name)
+        except ValueError:
+            cache.set(name, fresh_version(), timeout=version_timeout())
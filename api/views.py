@@ -1,4 +1,5 @@
-from django.http import HttpResponse, HttpRequest, JsonResponse
+from django.http import HttpResponse, HttpRequest, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from .forms import CustomUserCreationForm
@@ -7,13 +8,43 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import logout
 from django.views.generic import View
 from django.middleware.csrf import get_token
-from datetime import date
-from .models import CustomUser, Hobby, FriendRequest, Thread
+from .models import CustomUser, Hobby, FriendRequest, Friendship, Thread, clean_hobby_name, normalize_hobby_name
 from django.contrib.auth import update_session_auth_hash
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.conf import settings
+from . import autocomplete, caching, events, feed, fulltext, graph
+from .etags import own_friends, own_profile, versioned_etag
+from .signals import date_of_birth_changed, hobbies_changed, hobbies_created
+from .pagination import decode_cursor, encode_cursor
+from datetime import datetime
 import json
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+THREAD_PAGE_SIZE = 50
+MAX_THREAD_PAGE_SIZE = 100
+FRIEND_REQUEST_PAGE_SIZE = 50
+MAX_FRIEND_REQUEST_PAGE_SIZE = 100
+FRIEND_PAGE_SIZE = 50
+MAX_FRIEND_PAGE_SIZE = 100
+
+# Fields of list_friends, by the Friendship column each is read from
+FRIEND_FIELDS = {
+    "id": "friend_id",
+    "username": "friend__username",
+    "email": "friend__email",
+    "first_name": "friend__first_name",
+    "last_name": "friend__last_name",
+    "date_of_birth": "friend__date_of_birth",
+    "friends_since": "created_at",
+}
+DEFAULT_FRIEND_FIELDS = ["id", "username", "email"]
+GRAPH_PAGE_SIZE = 20
+MAX_GRAPH_PAGE_SIZE = 100
+HOBBY_SEARCH_SIZE = 10
+
 def register(request):
     # If the request method is POST, process the submitted form data
     if request.method == 'POST':
@@ -27,6 +58,7 @@ def register(request):
             # Save hobbies after the user is created
             hobbies = form.cleaned_data.get('hobbies')
             user.hobbies.set(hobbies)  # Manually set the hobbies (many-to-many field)
+            hobbies_changed.send(sender=CustomUser, user=user, added={hobby.id for hobby in hobbies or ()}, removed=set())
 
             # Display a success message after account creation
             messages.success(request, 'Your account has been created successfully. Please log in.')
@@ -53,6 +85,7 @@ def logout_view(request):
 
 
 @login_required
+@versioned_etag(own_profile)  # 304 until the profile or its hobbies change
 def current_user(request):
     user = request.user
     user_data = {
@@ -74,37 +107,26 @@ def main_spa(request: HttpRequest) -> HttpResponse:
 @login_required
 def top_users(request):
     user = request.user  # Current logged-in user
-    user_hobbies = user.hobbies.all()
-    user_similarity = []
     data = json.loads(request.body)
 
     min_age = int(data.get("min_age"))
     max_age = int(data.get("max_age"))
-    today = date.today()
-    other_user_age = 0
-
-    for other_user in CustomUser.objects.all():
-            if other_user.date_of_birth is not None and other_user!=user:
-                other_user_age = today.year - other_user.date_of_birth.year - ((today.month, today.day) < (other_user.date_of_birth.month, other_user.date_of_birth.day))
-
-                if min_age <= other_user_age and other_user_age <= max_age:
-                    common_hobbies = user_hobbies.intersection(other_user.hobbies.all())
-                    common_hobby_count = common_hobbies.count()
-                    user_similarity.append({
-                        'id': other_user.id,
-                        'username': other_user.username,
-                        'common_hobby_count': common_hobby_count
-                    })
-
-    user_similarity.sort(key=lambda x: x['common_hobby_count'], reverse=True)
     page_number = data.get("page",1)
+    cursor = data.get("cursor")  # next_cursor from a previous response
+    backend = "minhash" if data.get("approximate") else None  # Trade exactness for speed
+    similarity = data.get("similarity")  # "count", "jaccard" or "idf"
+
+    # Only users sharing at least one hobby are scored, see api/matching.py;
+    # pages are cached until a relevant hobby or birth date changes
+    try:
+        users, total_pages, next_cursor = caching.top_users(user, min_age, max_age, page_number, cursor, backend, similarity)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-    paginator = Paginator(user_similarity, 10)  
-    page_obj = paginator.get_page(page_number)
-    
     response_data = {
-        "users": list(page_obj.object_list),
-        "total_pages": paginator.num_pages,
+        "users": users,
+        "total_pages": total_pages,
+        "next_cursor": next_cursor,
     }
 
     return JsonResponse(response_data, safe=False)
@@ -113,7 +135,6 @@ def update_hobbies(request):
     if request.method == "POST":
         try:
             data = json.loads(request.body)  # Parse the JSON request body
-            print("Received data:", data)
 
             hobbies = data.get("hobbies")
             if hobbies is None:
@@ -123,28 +144,43 @@ def update_hobbies(request):
             if not user.is_authenticated:
                 return JsonResponse({"error": "Authentication required."}, status=401)
 
-            # Clear current hobbies and add new ones
-            user.hobbies.clear()
-
+            # normalized name -> name as submitted, so "Guitar" and "guitar " are one hobby
+            names = {}
             for hobby_data in hobbies:
-                hobby_name = hobby_data.get("name")
+                hobby_name = clean_hobby_name(hobby_data.get("name") or "")
                 if hobby_name:
-                    hobby, created = Hobby.objects.get_or_create(name=hobby_name)  # Create or get hobby from DB
-                    user.hobbies.add(hobby)  # Add hobby to user
-
-            # Check and delete hobbies that are no longer used by any user
-            all_hobbies = Hobby.objects.all()
-            for hobby in all_hobbies:
-                if not hobby.users.exists():  # If no users are associated with this hobby
-                    hobby.delete()  # Delete the hobby
+                    names.setdefault(normalize_hobby_name(hobby_name), hobby_name)
+
+            with transaction.atomic():
+                # Resolve every submitted name in one query and create the missing hobbies in bulk
+                hobby_ids = dict(Hobby.objects.filter(normalized_name__in=names).values_list("normalized_name", "id"))
+                missing = names.keys() - hobby_ids.keys()
+                if missing:
+                    Hobby.objects.bulk_create(
+                        [Hobby(name=names[normalized], normalized_name=normalized) for normalized in missing],
+                        ignore_conflicts=True,  # Created meanwhile by another request
+                    )
+                    hobby_ids.update(Hobby.objects.filter(normalized_name__in=missing).values_list("normalized_name", "id"))
+                    hobbies_created.send(sender=Hobby, hobby_ids=[hobby_ids[normalized] for normalized in missing])
+
+                # Only the through rows that changed are written
+                previous_ids = set(user.hobbies.values_list('id', flat=True))
+                current_ids = set(hobby_ids.values())
+                added, removed = current_ids - previous_ids, previous_ids - current_ids
+                if removed:
+                    user.hobbies.remove(*removed)
+                if added:
+                    user.hobbies.add(*added)
+                hobbies_changed.send(sender=CustomUser, user=user, added=added, removed=removed)
+            # Hobbies left without users are deleted later by the collect_hobbies command
 
             return JsonResponse({"message": "Hobbies updated successfully."}, status=200)
 
         except json.JSONDecodeError:
             return JsonResponse({"error": "Invalid JSON."}, status=400)
 
-        except Exception as e:
-            print("Error:", e)
+        except Exception:
+            logger.exception("Updating the hobbies of user %s failed", request.user.id)
             return JsonResponse({"error": "An error occurred while updating hobbies."}, status=500)
 
     return JsonResponse({"error": "Invalid request method."}, status=405)
@@ -154,9 +190,10 @@ def add_single_hobby(request):
         try:
             data = json.loads(request.body)  # Parse the JSON request body
             hobby_id = data.get("hobby_id")  # Expecting a single hobby ID
+            hobby_name = clean_hobby_name(data.get("name") or "")  # Or a name, created if new
 
-            if hobby_id is None:
-                return JsonResponse({"error": "Hobby ID is required."}, status=400)
+            if hobby_id is None and not hobby_name:
+                return JsonResponse({"error": "Hobby ID or name is required."}, status=400)
 
             user = request.user
             if not user.is_authenticated:
@@ -164,8 +201,15 @@ def add_single_hobby(request):
 
             # Add the hobby to the user's hobbies
             try:
-                hobby = Hobby.objects.get(id=hobby_id)
-                user.hobbies.add(hobby)  # Add hobby to user
+                if hobby_id is not None:
+                    hobby = Hobby.objects.get(id=hobby_id)
+                else:
+                    hobby, created = Hobby.objects.get_or_create(
+                        normalized_name=normalize_hobby_name(hobby_name), defaults={"name": hobby_name}
+                    )
+                if not user.hobbies.filter(id=hobby.id).exists():
+                    user.hobbies.add(hobby)  # Add hobby to user
+                    hobbies_changed.send(sender=CustomUser, user=user, added={hobby.id}, removed=set())
             except Hobby.DoesNotExist:
                 return JsonResponse({"error": "Hobby not found."}, status=404)
 
@@ -174,8 +218,8 @@ def add_single_hobby(request):
         except json.JSONDecodeError:
             return JsonResponse({"error": "Invalid JSON."}, status=400)
 
-        except Exception as e:
-            print("Error:", e)
+        except Exception:
+            logger.exception("Adding a hobby for user %s failed", request.user.id)
             return JsonResponse({"error": "An error occurred while adding the hobby."}, status=500)
 
     return JsonResponse({"error": "Invalid request method."}, status=405)
@@ -185,13 +229,17 @@ def update_profile(request):
     if request.method == "POST":
         data = json.loads(request.body)
         user = request.user  # Get the logged-in user
+        previous_date_of_birth = user.date_of_birth
         
         # Update user data
         user.first_name = data.get("first_name", user.first_name)
         user.last_name = data.get("last_name", user.last_name)
         user.email = data.get("email", user.email)
-        user.date_of_birth = data.get("date_of_birth", user.date_of_birth)
-        user.save()  # Save the updated user
+        user.date_of_birth = CustomUser._meta.get_field("date_of_birth").to_python(data.get("date_of_birth", user.date_of_birth))
+        # Only the edited fields, so counters maintained elsewhere are not overwritten
+        user.save(update_fields=["first_name", "last_name", "email", "date_of_birth"])  # Save the updated user
+        if user.date_of_birth != previous_date_of_birth:
+            date_of_birth_changed.send(sender=CustomUser, user=user)
 
         return JsonResponse({"message": "Profile updated successfully"})
     return JsonResponse({"message": "Invalid request"}, status=400)
@@ -215,7 +263,7 @@ def change_password(request):
             
             # Update the password
             user.set_password(new_password)
-            user.save()
+            user.save(update_fields=["password"])
 
             # Re-authenticate the user
             update_session_auth_hash(request, user)
@@ -248,8 +296,7 @@ def handle_friend_request(request):
         try:
             friend_request = FriendRequest.objects.get(id=request_id, to_user=request.user)
             if action == "accept":
-                request.user.friends.add(friend_request.from_user)  
-                friend_request.from_user.friends.add(request.user)
+                Friendship.objects.befriend(request.user, friend_request.from_user)
                 friend_request.delete()
                 return JsonResponse({"message": "Friend request accepted."}, status=200)
             elif action == "reject":
@@ -264,20 +311,47 @@ def handle_friend_request(request):
 @login_required
 def get_friend_requests(request):
     if request.method == "GET":
-        friend_requests = FriendRequest.objects.filter(to_user=request.user, status="pending")
+        try:
+            limit = min(max(int(request.GET.get("limit", FRIEND_REQUEST_PAGE_SIZE)), 1), MAX_FRIEND_REQUEST_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({"error": "limit must be a number"}, status=400)
+
+        friend_requests = FriendRequest.objects.filter(to_user=request.user, status="pending").order_by('-created_at', '-id')
+        cursor = request.GET.get("cursor")  # X-Next-Cursor of the previous page
+        if cursor:
+            try:
+                created_at, request_id = parse_time_cursor(cursor)
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            # Rows after (created_at, id) in the friend_request_inbox_idx order
+            friend_requests = friend_requests.filter(created_at__lte=created_at).exclude(created_at=created_at, id__gte=request_id)
+
+        # One joined query over the inbox index; one extra row tells whether there is a next page
+        page = list(friend_requests.values('id', 'created_at', 'from_user_id', 'from_user__username')[:limit + 1])
         requests_data = [
             {
-                "id": fr.id,
+                "id": fr["id"],
                 "from_user": {
-                    "id": fr.from_user.id,
-                    "username": fr.from_user.username,
+                    "id": fr["from_user_id"],
+                    "username": fr["from_user__username"],
                 },
             }
-            for fr in friend_requests
+            for fr in page[:limit]
         ]
-        return JsonResponse(requests_data, safe=False)
+        # The body stays a plain list for existing clients; the cursor goes in a header
+        response = JsonResponse(requests_data, safe=False)
+        if len(page) > limit:
+            last = page[limit - 1]
+            response["X-Next-Cursor"] = encode_cursor(last['created_at'].isoformat(), last['id'])
+        return response
     return JsonResponse({"error": "Invalid request method"}, status=400)
 
+@login_required
+def count_friend_requests(request):
+    # Counted from the inbox index alone
+    count = FriendRequest.objects.filter(to_user=request.user, status="pending").count()
+    return JsonResponse({"count": count})
+
 @login_required
 def send_friend_request(request):
     if request.method == "POST":
@@ -307,8 +381,7 @@ def accept_friend_request(request):
         
         try:
             friend_request = FriendRequest.objects.get(id=request_id, to_user=request.user)
-            request.user.friends.add(friend_request.from_user)
-            friend_request.from_user.friends.add(request.user)
+            Friendship.objects.befriend(request.user, friend_request.from_user)
             friend_request.delete()
             return JsonResponse({"message": "Friend request accepted"}, status=200)
         except FriendRequest.DoesNotExist:
@@ -316,21 +389,112 @@ def accept_friend_request(request):
     return JsonResponse({"error": "Invalid request method"}, status=405)
 
 @login_required
+@versioned_etag(own_friends)
 def get_friends(request):
     # Get the logged-in user
     user = request.user
-    # Fetch the friends related to the user
-    friends = user.friends.all()
-    # Create a list of dictionaries to return in the response
-    friend_list = [{"username": friend.username, "email": friend.email} for friend in friends]
+    # Only the two columns shown, not whole user rows; see list_friends for a paginated version
+    friend_list = list(user.friends.values("username", "email"))
     return JsonResponse(friend_list, safe=False)
 
 @login_required
+@versioned_etag(own_friends)
+def list_friends(request):
+    try:
+        limit = min(max(int(request.GET.get("limit", FRIEND_PAGE_SIZE)), 1), MAX_FRIEND_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "limit must be a number"}, status=400)
+    try:
+        cursor = request.GET.get("cursor")  # next_cursor of the previous page
+        cursor = parse_time_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    fields = request.GET.get("fields")
+    fields = fields.split(",") if fields else DEFAULT_FRIEND_FIELDS
+    unknown = [field for field in fields if field not in FRIEND_FIELDS]
+    if unknown:
+        return JsonResponse({"error": f"Unknown fields: {', '.join(unknown)}"}, status=400)
+
+    # Most recent friends first, as one range of friendship_recent_idx
+    friendships = Friendship.objects.filter(user=request.user).order_by('-created_at', '-friend_id')
+    if cursor:
+        created_at, friend_id = cursor
+        friendships = friendships.filter(created_at__lte=created_at).exclude(created_at=created_at, friend_id__gte=friend_id)
+    # Only the requested columns, plus the two the cursor is made of
+    columns = {FRIEND_FIELDS[field] for field in fields} | {"created_at", "friend_id"}
+    page = list(friendships.values(*columns)[:limit + 1])
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1]['created_at'].isoformat(), page[-1]['friend_id'])
+    response = {
+        "results": [{field: row[FRIEND_FIELDS[field]] for field in fields} for row in page],
+        "next_cursor": next_cursor,
+    }
+    if request.GET.get("include_total") in ("1", "true"):
+        # Counted from the (user, friend) index alone
+        response["total"] = Friendship.objects.filter(user=request.user).count()
+    return JsonResponse(response)
+
+def with_usernames(rows):
+    """Add each user's username to ``rows`` of dicts with an ``id``, in one query."""
+    usernames = dict(CustomUser.objects.filter(id__in=[row["id"] for row in rows]).values_list("id", "username"))
+    # Users deleted since the graph was loaded are left out
+    return [{**row, "username": usernames[row["id"]]} for row in rows if row["id"] in usernames]
+
+@login_required
+def mutual_friends(request, user_id):
+    try:
+        limit = min(max(int(request.GET.get("limit", GRAPH_PAGE_SIZE)), 1), MAX_GRAPH_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "limit must be a number"}, status=400)
+    # Served from the per-worker friend graph, see api/graph.py
+    mutual = graph.friend_graph.mutual_friends(request.user.id, user_id)
+    return JsonResponse({
+        "user_id": user_id,
+        "count": len(mutual),
+        "results": with_usernames([{"id": friend_id} for friend_id in mutual[:limit]]),
+    })
+
+@login_required
+def friend_degree(request, user_id):
+    return JsonResponse({"user_id": user_id, "degree": graph.friend_graph.degree(user_id)})
+
+@login_required
+def friends_of_friends(request):
+    try:
+        limit = min(max(int(request.GET.get("limit", GRAPH_PAGE_SIZE)), 1), MAX_GRAPH_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "limit must be a number"}, status=400)
+    candidates = graph.friend_graph.friends_of_friends(request.user.id, limit, settings.FRIEND_GRAPH_MAX_EDGES)
+    results = with_usernames([{"id": user_id, "mutual_friends": count} for user_id, count in candidates])
+    return JsonResponse({"results": results})
+
+@login_required
+@versioned_etag(autocomplete.VOCABULARY_VERSION)
 def get_all_hobbies(request):
     if request.method == "GET":
         hobbies = Hobby.objects.all().values('id','name')  
         return JsonResponse(list(hobbies), safe=False)
 
+def search_hobbies(request):
+    # Public, since the signup form autocompletes with it
+    if request.method != "GET":
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+    try:
+        limit = min(max(int(request.GET.get("limit", HOBBY_SEARCH_SIZE)), 1), autocomplete.MAX_RESULTS)
+    except ValueError:
+        return JsonResponse({"error": "limit must be a number"}, status=400)
+
+    # Served from the per-worker prefix index, see api/autocomplete.py
+    matches = autocomplete.search(request.GET.get("q", ""), limit)
+    results = [
+        {"id": hobby_id, "name": name, "user_count": user_count}
+        for hobby_id, name, user_count in matches
+    ]
+    return JsonResponse({"results": results})
+
 
 class HobbiesSPA(View):
     def get(self, request, *args, **kwargs):
@@ -354,8 +518,29 @@ def main_spa(request):
 
 def thread_list(request):
     if request.method == "GET":
-        threads = Thread.objects.order_by('-created_at').values('id', 'content', 'created_at', 'user__username')
-        return JsonResponse(list(threads), safe=False)
+        try:
+            limit = min(max(int(request.GET.get("limit", THREAD_PAGE_SIZE)), 1), MAX_THREAD_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({"error": "limit must be a number"}, status=400)
+
+        threads = Thread.objects.order_by('-created_at', '-id')
+        cursor = request.GET.get("cursor")  # X-Next-Cursor of the previous page
+        if cursor:
+            try:
+                created_at, thread_id = parse_time_cursor(cursor)
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            # Rows after (created_at, id) in the thread_recent_idx order, as one index range
+            threads = threads.filter(created_at__lte=created_at).exclude(created_at=created_at, id__gte=thread_id)
+
+        # One extra row tells whether there is a next page
+        page = list(threads.values('id', 'content', 'created_at', 'user__username')[:limit + 1])
+        # The body stays a plain list for existing clients; the cursor goes in a header
+        response = JsonResponse(page[:limit], safe=False)
+        if len(page) > limit:
+            last = page[limit - 1]
+            response["X-Next-Cursor"] = encode_cursor(last['created_at'].isoformat(), last['id'])
+        return response
 
     if request.method == "POST":
         if not request.user.is_authenticated:
@@ -372,4 +557,75 @@ def thread_list(request):
                 'created_at': thread.created_at,
                 'user': thread.user.username,
             })
-        return JsonResponse({'error': 'Content cannot be empty'}, status=400)
\ No newline at end of file
+        return JsonResponse({'error': 'Content cannot be empty'}, status=400)
+
+
+def parse_time_cursor(cursor):
+    """Decode a (created_at, id) cursor; raises ValueError if it is malformed."""
+    created_at, row_id = decode_cursor(cursor, 2)
+    try:
+        created_at = datetime.fromisoformat(created_at)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(row_id, int):
+        raise ValueError("Invalid cursor.")
+    return created_at, row_id
+
+
+def search_threads(request):
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return JsonResponse({"error": "q is required"}, status=400)
+    if not fulltext.supported():
+        return JsonResponse({"error": "Search is not available on this database"}, status=501)
+    try:
+        limit = min(max(int(request.GET.get("limit", THREAD_PAGE_SIZE)), 1), MAX_THREAD_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "limit must be a number"}, status=400)
+    try:
+        cursor = request.GET.get("cursor")  # next_cursor of the previous page
+        offset = decode_cursor(cursor, 1)[0] if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError("Invalid cursor.")
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    # Ranked by the full-text index, see api/fulltext.py; one extra row tells
+    # whether there is a next page
+    results = fulltext.search(query, limit + 1, offset)
+    next_cursor = encode_cursor(offset + limit) if len(results) > limit else None
+    return JsonResponse({"results": results[:limit], "next_cursor": next_cursor})
+
+
+@login_required
+async def event_stream(request):
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be held by one idle stream for as long as it is open
+        return JsonResponse({"error": "Event streams need an ASGI server"}, status=501)
+    user = await request.auser()
+    response = StreamingHttpResponse(events.stream(user.id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+def friends_feed(request):
+    try:
+        limit = min(max(int(request.GET.get("limit", THREAD_PAGE_SIZE)), 1), MAX_THREAD_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "limit must be a number"}, status=400)
+    try:
+        cursor = request.GET.get("cursor")  # next_cursor of the previous page
+        cursor = parse_time_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    # Timeline rows written when friends posted, see api/feed.py
+    page = feed.feed_page(request.user, limit, cursor)
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1]['created_at'].isoformat(), page[-1]['id'])
+    return JsonResponse({"results": page, "next_cursor": next_cursor})
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""
+Hobby popularity counters and the weights derived from them.
+
+``Hobby.user_count`` and ``CustomUser.hobby_count`` are kept up to date
+incrementally whenever hobbies change, so similarity modes needing them
+never have to aggregate the through table per request. Each worker also
+caches the IDF weights in memory, adjusting them for its own changes and
+reloading them after ``HOBBY_WEIGHTS_MAX_AGE`` seconds.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import CustomUser, Hobby
+from .signals import hobbies_changed
+
+UserHobby = CustomUser.hobbies.through
+
+SIMILARITIES = ('count', 'jaccard', 'idf')
+
+# Weighted scores are rounded so they compare equal across backends and cursors
+SCORE_DIGITS = 6
+
+
+def jaccard(common, size_a, size_b):
+    # max() guards against a counter that drifted below the overlap
+    return round(common / max(size_a + size_b - common, common, 1), SCORE_DIGITS)
+
+
+class HobbyWeights:
+    """Per-worker copy of every hobby's user count plus the total number of users."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.user_counts = None
+        self.total_users = 0
+        self.loaded_at = None
+
+    def idf(self, hobby_ids):
+        """Inverse document frequency of each hobby; rare hobbies weigh more."""
+        with self.lock:
+            if self.user_counts is None or time.monotonic() - self.loaded_at > settings.HOBBY_WEIGHTS_MAX_AGE:
+                self.user_counts = dict(Hobby.objects.values_list('id', 'user_count'))
+                self.total_users = CustomUser.objects.count()
+                self.loaded_at = time.monotonic()
+            return {
+                hobby_id: math.log(1 + self.total_users / max(self.user_counts.get(hobby_id, 0), 1))
+                for hobby_id in hobby_ids
+            }
+
+    def adjust(self, hobby_ids, step):
+        with self.lock:
+            if self.user_counts is not None:
+                for hobby_id in hobby_ids:
+                    self.user_counts[hobby_id] = max(self.user_counts.get(hobby_id, 0) + step, 0)
+
+    def adjust_users(self, step):
+        with self.lock:
+            self.total_users += step
+
+    def reset(self):
+        """Forget the loaded counts, e.g. after the database was replaced."""
+        with self.lock:
+            self.user_counts = None
+
+
+hobby_weights = HobbyWeights()
+
+
+def rebuild():
+    """Recompute both counters from the through table, e.g. after bulk imports."""
+    def counted(field, outer):
+        rows = UserHobby.objects.filter(**{field: OuterRef(outer)}).values(field).annotate(n=Count('id')).values('n')
+        return Coalesce(Subquery(rows), 0)
+
+    Hobby.objects.update(user_count=counted('hobby_id', 'pk'))
+    CustomUser.objects.update(hobby_count=counted('customuser_id', 'pk'))
+
+
+@receiver(hobbies_changed)
+def update_hobby_counts(sender, user, added, removed, **kwargs):
+    if added:
+        Hobby.objects.filter(id__in=added).update(user_count=F('user_count') + 1)
+    if removed:
+        Hobby.objects.filter(id__in=removed, user_count__gt=0).update(user_count=F('user_count') - 1)
+    if added or removed:
+        CustomUser.objects.filter(pk=user.id).update(hobby_count=F('hobby_count') + len(added) - len(removed))
+    hobby_weights.adjust(added, 1)
+    hobby_weights.adjust(removed, -1)
+
+
+@receiver(post_save, sender=CustomUser)
+def count_new_user(sender, instance, created, **kwargs):
+    if created:
+        hobby_weights.adjust_users(1)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def release_hobbies(sender, instance, **kwargs):
+    # The through rows are about to be cascaded away
+    hobby_ids = list(instance.hobbies.values_list('id', flat=True))
+    Hobby.objects.filter(id__in=hobby_ids, user_count__gt=0).update(user_count=F('user_count') - 1)
+    hobby_weights.adjust(hobby_ids, -1)
+
+
+@receiver(post_delete, sender=CustomUser)
+def uncount_user(sender, instance, **kwargs):
+    hobby_weights.adjust_users(-1)
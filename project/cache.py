@@ -0,0 +1,19 @@
+import os
+
+
+backends = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+
+
+def config():
+    # A per-process memory cache unless a shared one is configured, which is
+    # needed for invalidation to reach every worker.
+    backend = backends.get(os.getenv('CACHE_BACKEND'), backends['locmem'])
+    return {
+        'BACKEND': backend,
+        'LOCATION': os.getenv('CACHE_LOCATION', 'hobbiesapp'),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', 300)),
+    }
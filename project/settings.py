@@ -10,7 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/stable/ref/settings/
 """
 
-from . import database
+from . import cache, database
 import os
 
 from pathlib import Path
@@ -98,6 +98,23 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/stable/topics/cache/
+
+CACHES = {
+    'default': cache.config()
+}
+
+# Seconds a top_users page stays cached; hobby and birth date changes
+# invalidate it earlier, see api/caching.py
+RECOMMENDATION_CACHE_TIMEOUT = int(os.getenv('RECOMMENDATION_CACHE_TIMEOUT', 300))
+
+# Seconds a version counter lives in a per-process (locmem) cache, which
+# bounds how long a worker keeps serving data another process changed,
+# see api/versions.py. Counters in a shared cache never expire.
+VERSION_LOCAL_TIMEOUT = int(os.getenv('VERSION_LOCAL_TIMEOUT', 30))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/stable/ref/settings/#auth-password-validators
 
@@ -152,7 +169,45 @@ LOGIN_REDIRECT_URL = '/profile/'
 LOGOUT_REDIRECT_URL = '/login/'
 
 
+# Scoring backend for top_users, see api/matching.py
+# ('table', 'index', 'sparse', 'minhash' or 'precomputed')
+HOBBY_MATCH_BACKEND = os.getenv('HOBBY_MATCH_BACKEND', 'table')
+# Default similarity for top_users ('count', 'jaccard' or 'idf')
+HOBBY_MATCH_SIMILARITY = os.getenv('HOBBY_MATCH_SIMILARITY', 'count')
+# Seconds before a worker reloads its cached hobby IDF weights
+HOBBY_WEIGHTS_MAX_AGE = int(os.getenv('HOBBY_WEIGHTS_MAX_AGE', 300))
+# Seconds before the 'sparse' backend reloads its per-worker matrix
+HOBBY_MATRIX_MAX_AGE = int(os.getenv('HOBBY_MATRIX_MAX_AGE', 300))
+# LSH layout and limits of the approximate 'minhash' backend, see api/minhash.py
+HOBBY_LSH_BANDS = int(os.getenv('HOBBY_LSH_BANDS', 16))
+HOBBY_LSH_ROWS = int(os.getenv('HOBBY_LSH_ROWS', 2))
+HOBBY_LSH_MAX_CANDIDATES = int(os.getenv('HOBBY_LSH_MAX_CANDIDATES', 2000))
+HOBBY_LSH_MAX_AGE = int(os.getenv('HOBBY_LSH_MAX_AGE', 300))
+# Seconds before a worker rebuilds its hobby autocomplete index, see api/autocomplete.py
+HOBBY_SEARCH_MAX_AGE = int(os.getenv('HOBBY_SEARCH_MAX_AGE', 300))
+# Authors with more friends than this are not fanned out to their friends'
+# timelines; their threads are merged into feeds at read time, see api/feed.py
+FEED_FANOUT_MAX_FRIENDS = int(os.getenv('FEED_FANOUT_MAX_FRIENDS', 1000))
+# Threads of a new friend copied into the other's timeline
+FEED_BACKFILL_THREADS = int(os.getenv('FEED_BACKFILL_THREADS', 50))
+# Seconds before a worker reloads its friend graph, see api/graph.py
+FRIEND_GRAPH_MAX_AGE = int(os.getenv('FRIEND_GRAPH_MAX_AGE', 300))
+# Most friendships read to find one user's friends of friends
+FRIEND_GRAPH_MAX_EDGES = int(os.getenv('FRIEND_GRAPH_MAX_EDGES', 50000))
+# Friends of friends blended into top_users (0 to only use hobbies), see api/matching.py
+TOP_USERS_FOF_CANDIDATES = int(os.getenv('TOP_USERS_FOF_CANDIDATES', 100))
+# Shared hobbies a mutual friend is worth in a top_users score
+TOP_USERS_MUTUAL_FRIEND_WEIGHT = float(os.getenv('TOP_USERS_MUTUAL_FRIEND_WEIGHT', 1))
+# Seconds between heartbeat comments on an idle /events/ stream
+EVENTS_HEARTBEAT = int(os.getenv('EVENTS_HEARTBEAT', 15))
+# Events buffered for a slow /events/ client before its stream is closed
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 100))
+# Seconds a hobby must stay unused before collect_hobbies deletes it
+HOBBY_GC_GRACE = int(os.getenv('HOBBY_GC_GRACE', 24 * 3600))
+
 CORS_ALLOW_CREDENTIALS = True
+# Keyset pagination cursors of the list endpoints, see api/views.py
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor']
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  
     "http://127.0.0.1:5173",